@@ -1,8 +1,21 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import datetime
 from datetime import datetime as dt, timedelta
 import time
+import re
+import argparse
+import functools
+import threading
+import os
+import io
+import multiprocessing
+import hashlib
+import sqlite3
+from collections import OrderedDict
+from contextlib import closing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import plotly.graph_objects as go
 import plotly.express as px
 
@@ -16,10 +29,14 @@ except ImportError:
 # =========================
 # PAGE CONFIG
 # =========================
-st.set_page_config(
-    page_title="ENBD & EIB Dashboard",
-    layout="wide"
-)
+# Headless when run as a plain script (the --batch CLI); the UI only renders under `streamlit run`
+HEADLESS = not st.runtime.exists()
+
+if not HEADLESS:
+    st.set_page_config(
+        page_title="ENBD & EIB Dashboard",
+        layout="wide"
+    )
 
 # =========================
 # USER DATABASE
@@ -113,30 +130,38 @@ STATUS_NEGATIVE = [
     'RETURNS - FULLYPAID'
 ]
 
+# Partial/settlement categories reported for PTP and payment rows (REF B33:B44 order)
+PTP_CATEGORIES = ['PTP_PARTIAL', 'PAYMENT_PARTIAL', 'PTP_SETTLEMENT', 'PAYMENT_SETTLEMENT']
+
+# WOA time windows as (column, start, end); bounds are inclusive on the seconds-of-day clock
+# and may be 'HH:MM[:SS]' strings, datetime.time values or integer seconds
+WOA_WINDOWS = [
+    ('TOTAL_WOA (5pm)', '12:00:00', '17:00:00'),
+    ('TOTAL_WOA (9pm)', '17:00:01', '23:59:59'),
+]
+
 # =========================
 # SESSION STATE INITIALIZATION
 # =========================
-if "logged_in" not in st.session_state:
-    st.session_state.logged_in = False
-    st.session_state.username = ""
-    st.session_state.attempts = 0
-    st.session_state.lock_time = None
-    st.session_state.login_time = None
-
-if "enbd_data" not in st.session_state:
-    st.session_state.enbd_data = pd.DataFrame()
+if not HEADLESS:
+    if "logged_in" not in st.session_state:
+        st.session_state.logged_in = False
+        st.session_state.username = ""
+        st.session_state.attempts = 0
+        st.session_state.lock_time = None
+        st.session_state.login_time = None
 
-if "eib_data" not in st.session_state:
-    st.session_state.eib_data = pd.DataFrame()
+    if "start_date" not in st.session_state:
+        st.session_state.start_date = datetime.date.today()
 
-if "start_date" not in st.session_state:
-    st.session_state.start_date = datetime.date.today()
+    if "selected_tab" not in st.session_state:
+        st.session_state.selected_tab = "ENBD"
 
-if "selected_tab" not in st.session_state:
-    st.session_state.selected_tab = "ENBD"
+    if "pending_upload" not in st.session_state:
+        st.session_state.pending_upload = None
 
-if "pending_upload" not in st.session_state:
-    st.session_state.pending_upload = None
+    if "upload_cache" not in st.session_state:
+        st.session_state.upload_cache = OrderedDict()
 
 # ┌─────────────────────────────────────────────────────────────────────────────────┐
 # │         PASSWORD GENERATION & VALIDATION FUNCTIONS                              │
@@ -252,10 +277,249 @@ def login_page():
                             st.info(f"📍 Correct password: **{correct_password}**")
 
 
+# ┌─────────────────────────────────────────────────────────────────────────────────┐
+# │            MASTERLIST COLUMN RESOLVER                        │
+# └─────────────────────────────────────────────────────────────────────────────────┘
+
+# Canonical masterlist roles every metric reads, with their labels on the admin mapping form
+COLUMN_ROLES = {
+    "agent": "Agent (REMARK BY)",
+    "account": "Account",
+    "status": "Status",
+    "time": "Time",
+    "client": "Client",
+    "amount": "Amount (positive status threshold)",
+    "ptp_amount": "PTP amount",
+    "payment_amount": "Payment amount",
+}
+
+# Shared table with the admin's per-role overrides (ROLE -> COLUMN header)
+COLUMN_OVERRIDES_KEY = "column_overrides"
+COLUMN_OVERRIDE_COLUMNS = ["ROLE", "COLUMN"]
+
+# Amount headers are read in sheet order like VBA: the first is the PTP amount, the second the payment amount
+_AMOUNT_TERMS = ('PTP AMOUNT', 'AMT', 'PAYMENT')
+
+
+def _first_column(names, exact=(), contains=()):
+    """First header whose name is in `exact`, else the first containing one of `contains`"""
+    match = next((c for c, name in names if name in exact), None)
+    if match is None:
+        match = next((c for c, name in names if any(term in name for term in contains)), None)
+    return match
+
+
+@functools.lru_cache(maxsize=256)
+def _resolve_columns(header, overrides):
+    names = [(c, str(c).strip().upper()) for c in header]
+    by_name = {}
+    for c, name in names:
+        by_name.setdefault(name, c)
+    pinned = {
+        role: by_name[str(column).strip().upper()]
+        for role, column in overrides
+        if role in COLUMN_ROLES and str(column).strip().upper() in by_name
+    }
+
+    # Amount columns pinned to one role are not auto-assigned to the other
+    amounts = [c for c, name in names if any(term in name for term in _AMOUNT_TERMS) and c not in pinned.values()]
+    cols = {
+        'agent': _first_column(names, ('REMARK BY', 'REMARKBY'), ('AGENT',)),
+        'account': _first_column(names, ('ACCOUNT', 'DEBIT NUMBER', 'DEBIT NO', 'ACCT NO', 'ACCOUNT NO.'), ('ACCOUNT', 'ACCT')),
+        'status': _first_column(names, ('STATUS',), ('STATUS',)),
+        'time': _first_column(names, contains=('TIME',)),
+        'client': _first_column(names, contains=('CLIENT',)),
+        'amount': _first_column(names, ('AMOUNT',), ('AMOUNT',)),
+        'ptp_amount': amounts[0] if amounts else None,
+        'payment_amount': amounts[1] if len(amounts) >= 2 else None,
+    }
+    cols.update(pinned)
+    return cols
+
+
+# Set in masterlist worker processes to the parent's overrides, so workers never read the data store
+_worker_column_overrides = None
+
+
+def column_overrides():
+    """Admin overrides as a sorted tuple of (role, column) pairs"""
+    if _worker_column_overrides is not None:
+        return _worker_column_overrides
+    table = get_table(COLUMN_OVERRIDES_KEY, COLUMN_OVERRIDE_COLUMNS)
+    return tuple(sorted(zip(table['ROLE'], table['COLUMN'])))
+
+
+def resolve_columns(header):
+    """
+    Map a masterlist header to the column for each of COLUMN_ROLES (None when absent).
+    Memoized per header signature and override set, so detection runs once per file layout and
+    every metric reads the same columns. Overrides win whenever the header has that column
+    (matched case-insensitively). Treat the result as read-only.
+    """
+    return _resolve_columns(tuple(header), column_overrides())
+
+
+def set_column_override(role, column):
+    """Pin a role to a header, or clear its override (back to detection) when column is blank"""
+    table = get_table(COLUMN_OVERRIDES_KEY, COLUMN_OVERRIDE_COLUMNS)
+    delete_rows(COLUMN_OVERRIDES_KEY, table.index[table['ROLE'] == role])
+    if column:
+        append_rows(COLUMN_OVERRIDES_KEY, pd.DataFrame({'ROLE': [role], 'COLUMN': [column]}))
+
+
 # ┌─────────────────────────────────────────────────────────────────────────────────┐
 # │            DATA PROCESSING & TRANSFORMATION FUNCTIONS        │
 # └─────────────────────────────────────────────────────────────────────────────────┘
 
+_AMOUNT_JUNK = re.compile(r'[^0-9.()\-]')
+
+
+@functools.lru_cache(maxsize=65536)
+def _parse_amount(value):
+    """
+    One amount value to float: currency prefixes/suffixes and thousands separators are dropped,
+    "(1,000.00)" and trailing-minus "1,000.00-" are negative, anything else unparseable is NaN.
+    """
+    if isinstance(value, (int, float, np.number)):
+        return float(value)
+    text = _AMOUNT_JUNK.sub('', str(value))
+    negative = text.startswith('(') and text.endswith(')')
+    text = text.strip('()')
+    if text.endswith('-'):
+        negative, text = True, text[:-1]
+    if text.startswith('-'):
+        negative, text = not negative, text[1:]
+    try:
+        number = float(text)
+    except ValueError:
+        return np.nan
+    return -number if negative else number
+
+
+def parse_amounts(s):
+    """
+    Parse an amount column to float64 (unparseable -> NaN). Numeric columns are returned as-is;
+    otherwise only the distinct values are parsed (memoized across calls) and mapped back.
+    The float64 result keeps later calls on the same column on the numeric fast path.
+    """
+    if pd.api.types.is_numeric_dtype(s):
+        return s.astype('float64')
+    codes, uniques = pd.factorize(s)
+    parsed = np.array([_parse_amount(v) for v in uniques] + [np.nan], dtype='float64')
+    # Missing values have code -1, which picks the trailing NaN
+    return pd.Series(parsed[codes], index=s.index, name=s.name)
+
+
+def _clean_numeric_series(s):
+    """Sanitize amount strings like 'AED 1,000.00' into numbers (unparseable -> 0)"""
+    return parse_amounts(s).fillna(0)
+
+
+def _ref_status_lists(ref_col):
+    """
+    Extract the partial/settlement status lists from a REF sheet (or Series).
+    Returns (ptp_partial, payment_partial, ptp_settlement, payment_settlement); each is None when unavailable.
+    """
+    ptp_partial_list = None
+    payment_partial_list = None
+    ptp_settlement_list = None
+    payment_settlement_list = None
+    if ref_col is not None:
+        # ref_col may be a DataFrame (sheet) or a Series; prefer second column if available
+        try:
+            if isinstance(ref_col, pd.DataFrame):
+                ref_series = ref_col.iloc[:, 1] if ref_col.shape[1] > 1 else ref_col.iloc[:, 0]
+            else:
+                ref_series = ref_col
+
+            ref_series = ref_series.fillna('').astype(str).str.strip()
+            # Excel formulas referenced B33:B38, B39:B41, B42:B43, B44 (1-based)
+            if len(ref_series) >= 44:
+                ptp_partial_list = ref_series.iloc[32:38].str.upper().str.strip().tolist()
+                payment_partial_list = ref_series.iloc[38:41].str.upper().str.strip().tolist()
+                ptp_settlement_list = ref_series.iloc[41:43].str.upper().str.strip().tolist()
+                payment_settlement_list = [ref_series.iloc[43].upper().strip()]
+                # filter out empty strings
+                ptp_partial_list = [s for s in ptp_partial_list if s]
+                payment_partial_list = [s for s in payment_partial_list if s]
+                ptp_settlement_list = [s for s in ptp_settlement_list if s]
+                payment_settlement_list = [s for s in payment_settlement_list if s]
+        except Exception:
+            pass
+    return ptp_partial_list, payment_partial_list, ptp_settlement_list, payment_settlement_list
+
+
+# Status category codes (bit flags; a status can carry several)
+STATUS_RPC_FLAG = 1
+STATUS_POSITIVE_FLAG = 2
+STATUS_NEGATIVE_FLAG = 4
+STATUS_PTP_PAYMENT_FLAG = 8      # starts with PTP/PAYMENT or listed in the REF sheet
+STATUS_EXCLUDED_FLAG = 16        # FOLLOW UP / CLAIM PAID / FULLY PAID
+PTP_CATEGORY_FLAGS = dict(zip(PTP_CATEGORIES, (32, 64, 128, 256)))
+
+STATUS_EXCLUDED_TERMS = ('FOLLOW UP', 'CLAIM PAID', 'FULLY PAID')
+
+# Codes contributed by the fixed STATUS_* lists, uppercased once at import
+_STATUS_LIST_CODES = {}
+for _flag, _statuses in ((STATUS_RPC_FLAG, STATUS_RPC), (STATUS_POSITIVE_FLAG, STATUS_POSITIVE),
+                         (STATUS_NEGATIVE_FLAG, STATUS_NEGATIVE)):
+    for _status in _statuses:
+        _STATUS_LIST_CODES[_status.upper()] = _STATUS_LIST_CODES.get(_status.upper(), 0) | _flag
+
+
+def status_classifier(ref_lists=(None, None, None, None)):
+    """
+    Compile the STATUS_* lists, the PTP/PAYMENT prefix and exclusion rules and the REF
+    partial/settlement lists into one status -> category-code lookup. Codes for statuses
+    not listed anywhere are computed on first sight and memoized in the classifier.
+    """
+    codes = dict(_STATUS_LIST_CODES)
+    for category, statuses in zip(PTP_CATEGORIES, ref_lists):
+        for status in statuses or ():
+            codes[status] = codes.get(status, 0) | PTP_CATEGORY_FLAGS[category] | STATUS_PTP_PAYMENT_FLAG
+    return {
+        'codes': codes,
+        'memo': {},
+        'has_categories': any(ref_lists)
+    }
+
+
+def _status_code(classifier, status):
+    code = classifier['codes'].get(status, 0)
+    if status.startswith(('PTP', 'PAYMENT')):
+        code |= STATUS_PTP_PAYMENT_FLAG
+    if any(term in status for term in STATUS_EXCLUDED_TERMS):
+        code |= STATUS_EXCLUDED_FLAG
+    return code
+
+
+def classify_statuses(status, classifier):
+    """
+    Classify a Series of normalized (stripped, uppercased) statuses.
+    Returns (categorical statuses, integer category codes); each distinct status is classified once.
+    """
+    status = status.astype('category')
+    memo = classifier['memo']
+    category_codes = [
+        memo[value] if value in memo else memo.setdefault(value, _status_code(classifier, value))
+        for value in status.cat.categories
+    ]
+    # Missing values have code -1, which picks the trailing 0
+    lookup = np.array(category_codes + [0], dtype=np.int64)
+    return status, pd.Series(lookup[status.cat.codes.to_numpy()], index=status.index)
+
+
+def _expand_ptp_categories(rows, codes):
+    """One copy of each row per partial/settlement category its status code carries, tagged in CATEGORY"""
+    parts = [
+        rows[(codes & flag).to_numpy() != 0].assign(CATEGORY=category)
+        for category, flag in PTP_CATEGORY_FLAGS.items()
+    ]
+    return pd.concat(parts, ignore_index=True)
+
+
+# ────────────────────────────────────────────────────────────────────────────────────
+
 def process_masterlist(df, start_date, client_name):
     """
     Process uploaded masterlist:
@@ -265,12 +529,8 @@ def process_masterlist(df, start_date, client_name):
     """
     df_processed = df.copy()
 
-    # REMARK BY column is required for agent mapping
-    remark_by_col = None
-    for col in df_processed.columns:
-        if col.strip().upper() in ("REMARK BY", "REMARKBY"):
-            remark_by_col = col
-            break
+    # Agent column (REMARK BY unless overridden) is required for agent mapping
+    remark_by_col = resolve_columns(df_processed.columns)['agent']
 
     if remark_by_col is None:
         # No REMARK BY column found, 
@@ -335,33 +595,87 @@ def process_masterlist(df, start_date, client_name):
 
 # ────────────────────────────────────────────────────────────────────────────────────
 
-def generate_woa(df, time_col=None, acct_col=None, agent_col=None, client_col=None):
+def _seconds_of_day(value):
+    """Seconds since midnight for a WOA window bound ('HH:MM[:SS]', datetime.time or int)"""
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, datetime.time):
+        return value.hour * 3600 + value.minute * 60 + value.second
+    hours, minutes, seconds = ([int(p) for p in str(value).split(':')] + [0, 0])[:3]
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def hourly_woa_windows(start_hour=0, end_hour=24, label="WOA {:02d}:00"):
+    """Build one WOA window per hour, e.g. hourly_woa_windows(8, 22) for an 08:00-22:00 shift"""
+    return [(label.format(h), h * 3600, h * 3600 + 3599) for h in range(start_hour, end_hour)]
+
+
+def woa_window_codes(times, windows=WOA_WINDOWS):
+    """
+    Bin timestamps into WOA windows on the integer seconds-of-day clock.
+    Returns an int array of window positions (in `windows` order); -1 for NaT or no window.
+    """
+    starts = np.array([_seconds_of_day(start) for _, start, _ in windows])
+    ends = np.array([_seconds_of_day(end) for _, _, end in windows])
+    order = np.argsort(starts, kind='stable')
+    if len(order) > 1 and (starts[order][1:] <= ends[order][:-1]).any():
+        raise ValueError("WOA windows must not overlap")
+
+    times = pd.Series(times)
+    seconds = (times.dt.hour * 3600 + times.dt.minute * 60 + times.dt.second).fillna(-1).to_numpy(dtype=np.int64)
+
+    # Last window starting at or before each second, kept only if the second is within its end
+    slot = np.searchsorted(starts[order], seconds, side='right') - 1
+    candidate = order[np.clip(slot, 0, None)]
+    inside = (slot >= 0) & (seconds <= ends[candidate])
+    return np.where(inside, candidate, -1)
+
+
+def woa_window_matrix(times, agents, windows=WOA_WINDOWS):
+    """
+    Count rows per agent in every WOA window in one pass.
+    Returns an agent x window DataFrame (index AGENT_USER, sorted; one column per window label).
+    """
+    labels = [label for label, _, _ in windows]
+    codes = woa_window_codes(times, windows)
+    agent_codes, agent_index = pd.factorize(pd.Series(agents), sort=True)
+
+    hit = codes >= 0
+    flat = np.bincount(
+        agent_codes[hit] * len(labels) + codes[hit],
+        minlength=len(agent_index) * len(labels)
+    )
+    return pd.DataFrame(
+        flat.reshape(len(agent_index), len(labels)),
+        index=pd.Index(agent_index, name='AGENT_USER'),
+        columns=labels
+    )
+
+
+# ────────────────────────────────────────────────────────────────────────────────────
+
+def generate_woa(df, time_col=None, acct_col=None, agent_col=None, client_col=None, windows=WOA_WINDOWS):
     """
     Generate WOA lists and totals from a MASTERLIST-like DataFrame.
-    Ranges:
+    Ranges are the first two entries of `windows` (default WOA_WINDOWS):
       - first: 12:00 PM - 5:00 PM (inclusive)
-      - second: 5:01 PM - 11:59:59 PM
+      - second: 5:00:01 PM - 11:59:59 PM
 
     Returns: (first_df, second_df, total_first, total_second)
     """
     import pandas as _pd
-    from datetime import time as _time
 
     if df is None or df.empty:
         return _pd.DataFrame(), _pd.DataFrame(), 0, 0
 
     dfw = df.copy()
 
-    # Auto-detect columns if not provided
-    cols_upper = {c: c.upper() for c in dfw.columns}
-    if time_col is None:
-        time_col = next((c for c, cu in cols_upper.items() if 'TIME' in cu or 'TIMESTAMP' in cu), None)
-    if acct_col is None:
-        acct_col = next((c for c, cu in cols_upper.items() if 'ACCT' in cu or 'ACCOUNT' in cu), None)
-    if agent_col is None:
-        agent_col = next((c for c, cu in cols_upper.items() if 'AGENT' in cu or 'REMARK' in cu), None)
-    if client_col is None:
-        client_col = next((c for c, cu in cols_upper.items() if 'CLIENT' in cu or cu in ('EIB','ENBD')), None)
+    # Resolve columns that were not provided
+    cols = resolve_columns(dfw.columns)
+    time_col = time_col or cols['time']
+    acct_col = acct_col or cols['account']
+    agent_col = agent_col or cols['agent']
+    client_col = client_col or cols['client']
 
     # If we don't have required columns, return empties
     if not time_col or not acct_col or not agent_col or not client_col:
@@ -382,20 +696,14 @@ def generate_woa(df, time_col=None, acct_col=None, agent_col=None, client_col=No
     dfw = dfw.sort_values(time_col)
     latest = dfw.groupby('__key', as_index=False).last()
 
-    # extract time
-    latest['__t'] = latest[time_col].dt.time
-
-    def in_first(t):
-        return t >= _time(12, 0) and t <= _time(17, 0)
-
-    def in_second(t):
-        return t > _time(17, 0) and t <= _time(23, 59, 59)
+    # bin on seconds-of-day
+    window = woa_window_codes(latest[time_col], windows)
 
-    first = latest[latest['__t'].apply(in_first)][[acct_col, agent_col]].rename(
+    first = latest[window == 0][[acct_col, agent_col]].rename(
         columns={acct_col: 'Account', agent_col: 'Agent'}
     ).reset_index(drop=True)
 
-    second = latest[latest['__t'].apply(in_second)][[acct_col, agent_col]].rename(
+    second = latest[window == 1][[acct_col, agent_col]].rename(
         columns={acct_col: 'Account', agent_col: 'Agent'}
     ).reset_index(drop=True)
 
@@ -407,80 +715,47 @@ def generate_woa(df, time_col=None, acct_col=None, agent_col=None, client_col=No
 
 # ────────────────────────────────────────────────────────────────────────────────────
 
-def calculate_woa_per_agent(df, time_col=None, agent_col=None, client_col=None):
+def calculate_woa_per_agent(df, time_col=None, agent_col=None, client_col=None, windows=WOA_WINDOWS):
     """
     Calculate WOA counts per agent for each time range.
     Agent code comes from REMARK BY column.
-    Returns a DataFrame with AGENT_USER (from REMARK BY), TOTAL_WOA (5pm), and TOTAL_WOA (9pm).
+    Returns a DataFrame with AGENT_USER (from REMARK BY) and one count column per window
+    (default: TOTAL_WOA (5pm), TOTAL_WOA (9pm)).
     """
-    from datetime import time as _time
-    
+    empty = pd.DataFrame(columns=['AGENT_USER'] + [label for label, _, _ in windows])
     if df is None or df.empty:
-        return pd.DataFrame(columns=['AGENT_USER', 'TOTAL_WOA (5pm)', 'TOTAL_WOA (9pm)'])
-    
-    dfw = df.copy()
+        return empty
     
-    # Auto-detect columns if not provided
-    cols_upper = {c: c.upper() for c in dfw.columns}
-    if time_col is None:
-        time_col = next((c for c, cu in cols_upper.items() if 'TIME' in cu or 'TIMESTAMP' in cu), None)
-    
-    # For agent_col, prioritize REMARK BY over other columns
-    if agent_col is None:
-        agent_col = next((c for c, cu in cols_upper.items() if cu in ('REMARK BY', 'REMARKBY')), None)
-        if agent_col is None:
-            agent_col = next((c for c, cu in cols_upper.items() if 'AGENT' in cu), None)
-    
-    if client_col is None:
-        client_col = next((c for c, cu in cols_upper.items() if 'CLIENT' in cu), None)
+    # Resolve columns that were not provided (agent prioritizes REMARK BY)
+    cols = resolve_columns(df.columns)
+    time_col = time_col or cols['time']
+    agent_col = agent_col or cols['agent']
+    client_col = client_col or cols['client']
     
     if not time_col or not agent_col:
-        return pd.DataFrame(columns=['AGENT_USER', 'TOTAL_WOA (5pm)', 'TOTAL_WOA (9pm)'])
+        return empty
     
     # Parse datetime
-    dfw[time_col] = pd.to_datetime(dfw[time_col], errors='coerce')
-    dfw[agent_col] = dfw[agent_col].astype(str).str.strip().str.upper()
+    times = pd.to_datetime(df[time_col], errors='coerce')
+    keep = times.notna()
     
     # Filter by client if available
     if client_col:
-        dfw[client_col] = dfw[client_col].astype(str).str.strip().str.upper()
-        dfw = dfw[dfw[client_col].isin(['EIB', 'ENBD'])]
-    
-    dfw = dfw.dropna(subset=[agent_col, time_col])
-    
-    # Extract time component
-    dfw['__t'] = dfw[time_col].dt.time
-    
-    # Define ranges
-    def in_5pm(t):
-        return t >= _time(12, 0) and t <= _time(17, 0)
+        keep &= df[client_col].astype(str).str.strip().str.upper().isin(['EIB', 'ENBD'])
     
-    def in_9pm(t):
-        return t > _time(17, 0) and t <= _time(23, 59, 59)
+    agents = df.loc[keep, agent_col].astype(str).str.strip().str.upper()
     
-    dfw['__in_5pm'] = dfw['__t'].apply(in_5pm).astype(int)
-    dfw['__in_9pm'] = dfw['__t'].apply(in_9pm).astype(int)
-    
-    # Group by agent and sum WOA counts
-    result = dfw.groupby(agent_col, as_index=False).agg({
-        '__in_5pm': 'sum',
-        '__in_9pm': 'sum'
-    }).rename(columns={
-        agent_col: 'AGENT_USER',
-        '__in_5pm': 'TOTAL_WOA (5pm)',
-        '__in_9pm': 'TOTAL_WOA (9pm)'
-    })
-    
-    return result
+    # Agent x window counts on the seconds-of-day clock in one pass
+    return woa_window_matrix(times[keep], agents, windows).reset_index()
 
 
 # ────────────────────────────────────────────────────────────────────────────────────
 
 def count_accounts_per_agent(df, 
-                            account_col='Account',
-                            status_col='Status',
+                            account_col=None,
+                            status_col=None,
                             agent_col=None,
-                            amount_col='Amount'):
+                            amount_col=None):
     """
     Count unique accounts per agent based on status categories.
     Equivalent to VBA CountAccountsPerAgent_NoColOCondition.
@@ -490,85 +765,35 @@ def count_accounts_per_agent(df,
     if df is None or df.empty:
         return pd.DataFrame(columns=['AGENT_USER', 'TOTAL_WOA', 'POSITIVE', 'RPC', 'NEGATIVE'])
     
-    dff = df.copy()
-    
-    # Auto-detect agent column if not provided
-    if agent_col is None:
-        cols_upper = {c: c.upper() for c in dff.columns}
-        agent_col = next((c for c, cu in cols_upper.items() if cu in ('REMARK BY', 'REMARKBY')), None)
-        if agent_col is None:
-            agent_col = next((c for c, cu in cols_upper.items() if 'AGENT' in cu), None)
-    
-    # Auto-detect status and account columns
-    cols_upper = {c: c.upper() for c in dff.columns}
-    if status_col not in dff.columns:
-        status_col = next((c for c, cu in cols_upper.items() if 'STATUS' in cu), None)
-    if account_col not in dff.columns:
-        account_col = next((c for c, cu in cols_upper.items() if 'ACCOUNT' in cu or 'ACCT' in cu), None)
-    if amount_col not in dff.columns:
-        amount_col = next((c for c, cu in cols_upper.items() if 'AMOUNT' in cu), None)
+    # Resolve columns that were not provided (or are not in this frame)
+    cols = resolve_columns(df.columns)
+    agent_col = agent_col if agent_col in df.columns else cols['agent']
+    status_col = status_col if status_col in df.columns else cols['status']
+    account_col = account_col if account_col in df.columns else cols['account']
+    amount_col = amount_col if amount_col in df.columns else cols['amount']
     
     if not agent_col or not account_col or not status_col:
         return pd.DataFrame(columns=['AGENT_USER', 'TOTAL_WOA', 'POSITIVE', 'RPC', 'NEGATIVE'])
     
-    # Normalize columns
-    dff[agent_col] = dff[agent_col].astype(str).str.strip().str.upper()
-    dff[account_col] = dff[account_col].astype(str).str.strip()
-    dff[status_col] = dff[status_col].astype(str).str.strip().str.upper()
-    
-    def _clean_numeric_series(s):
-        ss = s.fillna('').astype(str).str.strip()
-        # remove commas, currency symbols, parentheses and any non-numeric except dot and minus
-        ss = ss.str.replace(r'[^0-9\.\-]', '', regex=True)
-        ss = ss.replace('', '0')
-        return pd.to_numeric(ss, errors='coerce').fillna(0)
+    # Normalize columns once; status lists are uppercased once per call, not per agent
+    agents = df[agent_col].astype(str).str.strip().str.upper()
+    accounts = df[account_col].astype(str).str.strip()
+    _, codes = classify_statuses(df[status_col].astype(str).str.strip().str.upper(), status_classifier())
+    amount = _clean_numeric_series(df[amount_col]) if amount_col else 0
+
+    # Each bucket keeps the account only where the row qualifies, so nunique counts distinct accounts:
+    # P: all accounts, Q: positive status + amt <= 1, R: RPC status, S: negative status
+    buckets = pd.DataFrame({
+        'TOTAL_WOA': accounts,
+        'POSITIVE': accounts.where(((codes & STATUS_POSITIVE_FLAG) != 0) & (amount <= 1)),
+        'RPC': accounts.where((codes & STATUS_RPC_FLAG) != 0),
+        'NEGATIVE': accounts.where((codes & STATUS_NEGATIVE_FLAG) != 0)
+    })
+    has_agent = agents != ''
 
-    if amount_col:
-        dff[amount_col] = _clean_numeric_series(dff[amount_col])
-    else:
-        dff['__amount'] = 0
-        amount_col = '__amount'
-    
-    # Group by agent
-    result = []
-    for agent in dff[agent_col].unique():
-        if not agent or agent == '':
-            continue
-        
-        agent_data = dff[dff[agent_col] == agent]
-        
-        # P: All unique accounts
-        p_accounts = agent_data[account_col].unique()
-        p_count = len(p_accounts)
-        
-        # Q: Status in STATUS_POSITIVE AND amount <= 1
-        q_data = agent_data[
-            (agent_data[status_col].isin([s.upper() for s in STATUS_POSITIVE])) &
-            (agent_data[amount_col] <= 1)
-        ]
-        q_count = len(q_data[account_col].unique())
-        
-        # R: Status in STATUS_RPC
-        r_data = agent_data[
-            agent_data[status_col].isin([s.upper() for s in STATUS_RPC])
-        ]
-        r_count = len(r_data[account_col].unique())
-        
-        # S: Status in STATUS_NEGATIVE
-        s_data = agent_data[
-            agent_data[status_col].isin([s.upper() for s in STATUS_NEGATIVE])
-        ]
-        s_count = len(s_data[account_col].unique())
-        
-        result.append({
-            'AGENT_USER': agent,
-            'TOTAL_WOA': p_count,      # P = all unique accounts
-            'POSITIVE': q_count,        # Q = positive status + amt <= 1
-            'RPC': r_count,            # R = RPC status
-            'NEGATIVE': s_count        # S = negative status
-        })
-    
-    return pd.DataFrame(result)
+    # One groupby pass; agents keep their order of first appearance
+    result = buckets[has_agent].groupby(agents[has_agent], sort=False).nunique()
+    return result.rename_axis('AGENT_USER').reset_index()
 
 
 # ────────────────────────────────────────────────────────────────────────────────────
@@ -587,195 +812,1263 @@ def get_ptp_and_payment_data(df, ref_col=None):
     if df.empty:
         return pd.DataFrame()
     
-    df_copy = df.copy()
-    
-    # Find status column (case-insensitive)
-    status_col = None
-    for col in df_copy.columns:
-        if col.strip().upper() in ("Status",):
-            status_col = col
-            break
-    
-    if status_col is None:
+    # Status, agent, account and amount columns come from the shared resolver
+    cols = resolve_columns(df.columns)
+    status_col = cols['status']
+    agent_col = cols['agent']
+    account_col = cols['account']
+    if status_col is None or agent_col is None:
         return pd.DataFrame()
-    
-    # Find agent column - prioritize REMARK BY
-    agent_col = None
-    for col in df_copy.columns:
-        if col.strip().upper() in ("REMARK BY", "REMARKBY"):
-            agent_col = col
-            break
-    
-    if agent_col is None:
-        return pd.DataFrame()
-    
-    # Find amount columns (look for various patterns)
-    amount_cols = []
-    for col in df_copy.columns:
-        col_upper = col.strip().upper()
-        if 'PTP AMOUNT' in col_upper or 'AMT' in col_upper or 'PAYMENT' in col_upper:
-            amount_cols.append(col)
 
-    # If a REF column/df is provided, attempt to extract status lists similar to the Excel REF ranges
-    ptp_partial_list = None
-    payment_partial_list = None
-    ptp_settlement_list = None
-    payment_settlement_list = None
-    if ref_col is not None:
-        # ref_col may be a DataFrame (sheet) or a Series; prefer second column if available
-        try:
-            if isinstance(ref_col, pd.DataFrame):
-                ref_series = ref_col.iloc[:, 1] if ref_col.shape[1] > 1 else ref_col.iloc[:, 0]
-            else:
-                ref_series = ref_col
+    # PTP amount then payment amount; a lone amount column serves both
+    amount_cols = [c for c in (cols['ptp_amount'], cols['payment_amount']) if c]
 
-            ref_series = ref_series.fillna('').astype(str).str.strip()
-            # Excel formulas referenced B33:B38, B39:B41, B42:B43, B44 (1-based)
-            if len(ref_series) >= 44:
-                ptp_partial_list = ref_series.iloc[32:38].str.upper().str.strip().tolist()
-                payment_partial_list = ref_series.iloc[38:41].str.upper().str.strip().tolist()
-                ptp_settlement_list = ref_series.iloc[41:43].str.upper().str.strip().tolist()
-                payment_settlement_list = [ref_series.iloc[43].upper().strip()]
-                # filter out empty strings
-                ptp_partial_list = [s for s in ptp_partial_list if s]
-                payment_partial_list = [s for s in payment_partial_list if s]
-                ptp_settlement_list = [s for s in ptp_settlement_list if s]
-                payment_settlement_list = [s for s in payment_settlement_list if s]
-        except Exception:
-            pass
+    # If a REF column/df is provided, attempt to extract status lists similar to the Excel REF ranges
+    classifier = status_classifier(_ref_status_lists(ref_col))
     
-    # Make status uppercase for filtering
-    df_copy[status_col] = df_copy[status_col].astype(str).str.upper().str.strip()
+    # Make status uppercase and classify each distinct value once
+    _, codes = classify_statuses(df[status_col].astype(str).str.upper().str.strip(), classifier)
     
     # Filter 1: Status starts with PTP or PAYMENT OR matches REF lists when provided
-    ptp_payment_mask = (
-        df_copy[status_col].str.contains('^PTP', regex=True, na=False) |
-        df_copy[status_col].str.contains('^PAYMENT', regex=True, na=False)
-    )
-    if ptp_partial_list or payment_partial_list or ptp_settlement_list or payment_settlement_list:
-        status_vals = df_copy[status_col]
-        match_mask = pd.Series([False] * len(df_copy))
-        if ptp_partial_list:
-            match_mask = match_mask | status_vals.isin(ptp_partial_list)
-        if payment_partial_list:
-            match_mask = match_mask | status_vals.isin(payment_partial_list)
-        if ptp_settlement_list:
-            match_mask = match_mask | status_vals.isin(ptp_settlement_list)
-        if payment_settlement_list:
-            match_mask = match_mask | status_vals.isin(payment_settlement_list)
-        ptp_payment_mask = ptp_payment_mask | match_mask
+    ptp_payment_mask = (codes & STATUS_PTP_PAYMENT_FLAG) != 0
     
     # Filter 2: Exclude FOLLOW UP, CLAIM PAID, FULLY PAID
-    exclude_mask = (
-        df_copy[status_col].str.contains('FOLLOW UP', na=False) |
-        df_copy[status_col].str.contains('CLAIM PAID', na=False) |
-        df_copy[status_col].str.contains('FULLY PAID', na=False)
-    )
+    exclude_mask = (codes & STATUS_EXCLUDED_FLAG) != 0
     
-    # Filter 3: Not both amount columns are 0
-    amount_both_zero = pd.Series([False] * len(df_copy))
-
-    def _clean_numeric_series_local(s):
-        ss = s.fillna('').astype(str).str.strip()
-        ss = ss.str.replace(r'[^0-9\.\-]', '', regex=True)
-        ss = ss.replace('', '0')
-        return pd.to_numeric(ss, errors='coerce').fillna(0)
-
+    # Filter 3: Not both amount columns are 0 (amounts are parsed once)
+    amounts = {col: _clean_numeric_series(df[col]) for col in amount_cols}
+    keep = ptp_payment_mask & ~exclude_mask
     if len(amount_cols) >= 2:
-        # Check if both first two amount columns are 0 (sanitize strings like '1,000.00')
-        col1, col2 = amount_cols[0], amount_cols[1]
-        num1 = _clean_numeric_series_local(df_copy[col1])
-        num2 = _clean_numeric_series_local(df_copy[col2])
-        amount_both_zero = (num1 == 0) & (num2 == 0)
-    
-    # Apply all filters
-    df_filtered = df_copy[ptp_payment_mask & ~exclude_mask & ~amount_both_zero].copy()
-    
-    if df_filtered.empty:
-        return pd.DataFrame()
+        keep &= ~((amounts[amount_cols[0]] == 0) & (amounts[amount_cols[1]] == 0))
     
-    # Extract agent from REMARK BY
-    df_filtered["AGENT_USER"] = df_filtered[agent_col].astype(str).str.strip().str.upper()
+    # Extract agent from REMARK BY and keep only known agents
+    agent_user = df[agent_col].astype(str).str.strip().str.upper()
+    keep &= agent_user.map(AGENT_USER_TO_NAME).notna()
     
-    # Map to known agents
-    df_filtered["AGENT_NAME"] = df_filtered["AGENT_USER"].map(AGENT_USER_TO_NAME)
-    
-    # Filter to only known agents
-    df_filtered = df_filtered[df_filtered["AGENT_NAME"].notna()].copy()
-    
-    if df_filtered.empty:
+    if not keep.any():
         return pd.DataFrame()
     
-    # Find account/debit number column
-    account_col = None
-    for col in df_filtered.columns:
-        col_upper = col.strip().upper()
-        if col_upper in ('ACCOUNT', 'DEBIT NUMBER', 'DEBIT NO', 'ACCT NO', 'ACCOUNT NO.'):
-            account_col = col
-            break
-    
-    # Identify amount columns for PTP vs Payment (fallback to first/second found)
-    ptp_amt_col = amount_cols[0] if len(amount_cols) >= 1 else None
-    payment_amt_col = amount_cols[1] if len(amount_cols) >= 2 else (amount_cols[0] if amount_cols else None)
-
-    # Aggregate by agent
-    result = []
-    for agent in df_filtered["AGENT_USER"].unique():
-        agent_data = df_filtered[df_filtered["AGENT_USER"] == agent]
-        
+    agents_in_order = agent_user[keep].unique()
+    result = pd.DataFrame({'AGENT_USER': agents_in_order})
+    result['AGENT_NAME'] = result['AGENT_USER'].map(AGENT_USER_TO_NAME)
+
+    # Expand rows into the partial/settlement categories their status codes carry, then pivot per agent
+    counts = totals = pd.DataFrame(0, index=agents_in_order, columns=PTP_CATEGORIES)
+    if amount_cols and classifier['has_categories']:
+        rows = _expand_ptp_categories(pd.DataFrame({
+            'AGENT_USER': agent_user[keep],
+            'ACCOUNT': df.loc[keep, account_col].astype(str).str.strip() if account_col else None,
+            'PTP_AMOUNT': amounts[amount_cols[0]][keep],
+            'PAYMENT_AMOUNT': amounts[amount_cols[-1]][keep]
+        }), codes[keep])
+        # PTP_* categories sum the PTP amount column, PAYMENT_* the payment amount column
+        rows['AMOUNT'] = rows['PTP_AMOUNT'].where(rows['CATEGORY'].str.startswith('PTP_'), rows['PAYMENT_AMOUNT'])
+
+        grouped = rows.groupby(['AGENT_USER', 'CATEGORY'])
+        if account_col:
+            counts = grouped['ACCOUNT'].nunique(dropna=False).unstack('CATEGORY')
+        else:
+            counts = grouped.size().unstack('CATEGORY')
+        totals = grouped['AMOUNT'].sum().unstack('CATEGORY')
 
-        
-        # Sum amounts if amount columns exist (sanitize strings like '1,000.00')
-        total_amount = 0
-        if amount_cols:
-            for col in amount_cols[:2]:  # Use first two amount columns like VBA
-                total_amount += _clean_numeric_series_local(agent_data[col]).sum()
-
-        # Calculate partial vs settlement breakdown using REF lists when available
-        ptp_partial_amt = 0
-        ptp_partial_count = 0
-        payment_partial_amt = 0
-        payment_partial_count = 0
-
-        ptp_settlement_amt = 0
-        ptp_settlement_count = 0
-        payment_settlement_amt = 0
-        payment_settlement_count = 0
-
-        if ptp_partial_list and ptp_amt_col:
-            mask = agent_data[status_col].isin(ptp_partial_list)
-            ptp_partial_amt = _clean_numeric_series_local(agent_data.loc[mask, ptp_amt_col]).sum()
-            ptp_partial_count = len(agent_data.loc[mask, account_col].unique()) if account_col else int(mask.sum())
-
-        if payment_partial_list and payment_amt_col:
-            mask = agent_data[status_col].isin(payment_partial_list)
-            payment_partial_amt = _clean_numeric_series_local(agent_data.loc[mask, payment_amt_col]).sum()
-            payment_partial_count = len(agent_data.loc[mask, account_col].unique()) if account_col else int(mask.sum())
-
-        if ptp_settlement_list and ptp_amt_col:
-            mask = agent_data[status_col].isin(ptp_settlement_list)
-            ptp_settlement_amt = _clean_numeric_series_local(agent_data.loc[mask, ptp_amt_col]).sum()
-            ptp_settlement_count = len(agent_data.loc[mask, account_col].unique()) if account_col else int(mask.sum())
-
-        if payment_settlement_list and payment_amt_col:
-            mask = agent_data[status_col].isin(payment_settlement_list)
-            payment_settlement_amt = _clean_numeric_series_local(agent_data.loc[mask, payment_amt_col]).sum()
-            payment_settlement_count = len(agent_data.loc[mask, account_col].unique()) if account_col else int(mask.sum())
-        
-        result.append({
-            'AGENT_USER': agent,
-            'AGENT_NAME': agent_data["AGENT_NAME"].iloc[0],
-            'PTP_PARTIAL_COUNT': ptp_partial_count,
-            'PTP_PARTIAL_AMOUNT': ptp_partial_amt,
-            'PAYMENT_PARTIAL_COUNT': payment_partial_count,
-            'PAYMENT_PARTIAL_AMOUNT': payment_partial_amt,
-            'PTP_SETTLEMENT_COUNT': ptp_settlement_count,
-            'PTP_SETTLEMENT_AMOUNT': ptp_settlement_amt,
-            'PAYMENT_SETTLEMENT_COUNT': payment_settlement_count,
-            'PAYMENT_SETTLEMENT_AMOUNT': payment_settlement_amt
-        })
+    counts = counts.reindex(index=agents_in_order, columns=PTP_CATEGORIES).fillna(0).astype(int)
+    totals = totals.reindex(index=agents_in_order, columns=PTP_CATEGORIES).fillna(0)
+    for category in PTP_CATEGORIES:
+        result[f'{category}_COUNT'] = counts[category].to_numpy()
+        result[f'{category}_AMOUNT'] = totals[category].to_numpy()
     
-    return pd.DataFrame(result)
+    return result
+
+
+# ┌─────────────────────────────────────────────────────────────────────────────────┐
+# │            MASTERLIST ANALYTICS ENGINE                       │
+# └─────────────────────────────────────────────────────────────────────────────────┘
+
+# Rows per read_csv chunk; peak memory follows this instead of the upload size
+MASTERLIST_CHUNK_ROWS = 100_000
+
+# Metric columns process_masterlist carries over (and sums) when an upload already has them
+MASTERLIST_METRIC_COLUMNS = [
+    "TOTAL_WOA", "NEGATIVE", "RPC", "POSITIVE", "TOTAL_PTP_COUNT", "TOTAL_PAYMENT_COUNT",
+    "TOTAL_TALK_TIME", "PTP_PERCENTAGE", "NEW_RPC", "NEW_IDP_ACTIVE", "GRACE_PERCENTAGE"
+]
+
+
+def _normalize_masterlist(df, cols, classifier, rows=None):
+    """
+    Normalize the resolved role columns exactly once, into a compact frame with canonical names.
+    A source column serving several roles (e.g. one amount column) is only converted once.
+    The status column becomes a categorical with its classifier codes alongside.
+    `rows` are the rows' positions in the file (default 0..n-1), used for first-appearance order.
+    """
+    converted = {}
+
+    def _text(col, upper=True):
+        if (col, upper) not in converted:
+            values = df[col].astype(str).str.strip()
+            converted[(col, upper)] = values.str.upper() if upper else values
+        return converted[(col, upper)]
+
+    def _amount(col):
+        if (col, 'amount') not in converted:
+            converted[(col, 'amount')] = _clean_numeric_series(df[col])
+        return converted[(col, 'amount')]
+
+    norm = pd.DataFrame({'ROW': rows if rows is not None else range(len(df))}, index=df.index)
+    if cols['agent']:
+        norm['AGENT'] = _text(cols['agent'])
+    if cols['status']:
+        norm['STATUS'], norm['STATUS_CODE'] = classify_statuses(_text(cols['status']), classifier)
+    if cols['account']:
+        norm['ACCOUNT'] = _text(cols['account'], upper=False)
+    if cols['amount']:
+        norm['AMOUNT'] = _amount(cols['amount'])
+    if cols['ptp_amount']:
+        norm['PTP_AMOUNT'] = _amount(cols['ptp_amount'])
+    if cols['payment_amount']:
+        norm['PAYMENT_AMOUNT'] = _amount(cols['payment_amount'])
+    if cols['time']:
+        norm['TIME'] = pd.to_datetime(df[cols['time']], errors='coerce')
+    if cols['client']:
+        norm['CLIENT'] = _text(cols['client'])
+    for col in MASTERLIST_METRIC_COLUMNS:
+        if col in df.columns:
+            norm[col] = df[col]
+    return norm
+
+
+# ────────────────────────────────────────────────────────────────────────────────────
+
+def _reduce_agents(frame):
+    """Collapse process_masterlist inputs to one row per REMARK BY (sum metrics, keep first percentage)"""
+    agg = {c: ('first' if 'PERCENTAGE' in c else 'sum') for c in frame.columns if c != 'REMARK BY'}
+    if not agg:
+        return frame.drop_duplicates('REMARK BY')
+    return frame.groupby('REMARK BY', as_index=False, sort=False).agg(agg)
+
+
+def _reduce_accounts(frame):
+    """Collapse to distinct (agent, account) pairs, keeping which status buckets each pair hit"""
+    return frame.groupby(['AGENT_USER', 'ACCOUNT'], as_index=False, sort=False).agg(
+        POSITIVE=('POSITIVE', 'max'),
+        RPC=('RPC', 'max'),
+        NEGATIVE=('NEGATIVE', 'max'),
+        FIRST_ROW=('FIRST_ROW', 'min')
+    )
+
+
+def _reduce_woa(frame):
+    return frame.groupby(level=0).sum()
+
+
+def _reduce_ptp(frame):
+    return frame.groupby(['AGENT_USER', 'ACCOUNT', 'CATEGORY'], as_index=False, sort=False, dropna=False)[
+        ['AMOUNT', 'ROWS']
+    ].sum()
+
+
+def _reduce_ptp_order(series):
+    return series.groupby(level=0, sort=False).min()
+
+
+_PARTIAL_REDUCERS = {
+    'agents': _reduce_agents,
+    'accounts': _reduce_accounts,
+    'woa': _reduce_woa,
+    'ptp': _reduce_ptp,
+    'ptp_order': _reduce_ptp_order,
+}
+
+
+# ────────────────────────────────────────────────────────────────────────────────────
+
+def _agents_partial(norm):
+    """process_masterlist partial: known agents with their summed metric columns"""
+    if 'AGENT' not in norm.columns:
+        return None
+
+    known = norm['AGENT'].map(AGENT_USER_TO_NAME).notna()
+    metric_cols = [c for c in MASTERLIST_METRIC_COLUMNS if c in norm.columns]
+    part = norm.loc[known, metric_cols].copy()
+    part.insert(0, 'REMARK BY', norm.loc[known, 'AGENT'])
+    return _reduce_agents(part)
+
+
+def _accounts_partial(norm):
+    """count_accounts_per_agent partial: distinct (agent, account) pairs with status bucket flags"""
+    if not {'AGENT', 'ACCOUNT', 'STATUS'}.issubset(norm.columns):
+        return None
+
+    codes = norm['STATUS_CODE']
+    amount = norm['AMOUNT'] if 'AMOUNT' in norm.columns else 0
+    frame = pd.DataFrame({
+        'AGENT_USER': norm['AGENT'],
+        'ACCOUNT': norm['ACCOUNT'],
+        'POSITIVE': ((codes & STATUS_POSITIVE_FLAG) != 0) & (amount <= 1),
+        'RPC': (codes & STATUS_RPC_FLAG) != 0,
+        'NEGATIVE': (codes & STATUS_NEGATIVE_FLAG) != 0,
+        'FIRST_ROW': norm['ROW']
+    })
+    return _reduce_accounts(frame[frame['AGENT_USER'] != ''])
+
+
+def _woa_partial(norm, windows):
+    """calculate_woa_per_agent partial: per-agent row counts in each time window"""
+    if not {'TIME', 'AGENT'}.issubset(norm.columns):
+        return None
+
+    keep = norm['TIME'].notna()
+    if 'CLIENT' in norm.columns:
+        keep &= norm['CLIENT'].isin(['EIB', 'ENBD'])
+    return woa_window_matrix(norm.loc[keep, 'TIME'], norm.loc[keep, 'AGENT'], windows)
+
+
+def _ptp_partial(norm, has_categories):
+    """
+    get_ptp_and_payment_data partial.
+    Returns (per agent/account/category amount sums, first row per agent).
+    """
+    if not {'STATUS', 'AGENT'}.issubset(norm.columns):
+        return None, None
+
+    # PTP amount then payment amount; a lone amount column serves both
+    amount_cols = [c for c in ('PTP_AMOUNT', 'PAYMENT_AMOUNT') if c in norm.columns]
+
+    codes = norm['STATUS_CODE']
+    keep = ((codes & STATUS_PTP_PAYMENT_FLAG) != 0) & ((codes & STATUS_EXCLUDED_FLAG) == 0)
+    if len(amount_cols) >= 2:
+        keep &= ~((norm['PTP_AMOUNT'] == 0) & (norm['PAYMENT_AMOUNT'] == 0))
+    keep &= norm['AGENT'].map(AGENT_USER_TO_NAME).notna()
+    if not keep.any():
+        return None, None
+
+    agent_user = norm['AGENT']
+    order = _reduce_ptp_order(norm.loc[keep, 'ROW'].set_axis(agent_user[keep]))
+
+    if not amount_cols or not has_categories:
+        return None, order
+
+    rows = _expand_ptp_categories(pd.DataFrame({
+        'AGENT_USER': agent_user[keep],
+        'ACCOUNT': norm.loc[keep, 'ACCOUNT'] if 'ACCOUNT' in norm.columns else None,
+        'PTP_AMOUNT': norm.loc[keep, amount_cols[0]],
+        'PAYMENT_AMOUNT': norm.loc[keep, amount_cols[-1]],
+        'ROWS': 1
+    }), codes[keep])
+    rows['AMOUNT'] = rows['PTP_AMOUNT'].where(rows['CATEGORY'].str.startswith('PTP_'), rows['PAYMENT_AMOUNT'])
+    return _reduce_ptp(rows), order
+
+
+def _masterlist_partial(norm, classifier, woa_windows=WOA_WINDOWS):
+    """Compute per-agent partial aggregates for every metric from one normalized frame"""
+    ptp, ptp_order = _ptp_partial(norm, classifier['has_categories'])
+    return {
+        'agents': _agents_partial(norm),
+        'accounts': _accounts_partial(norm),
+        'woa': _woa_partial(norm, woa_windows),
+        'ptp': ptp,
+        'ptp_order': ptp_order,
+    }
+
+
+def _merge_masterlist_partials(total, part):
+    """Fold one batch of partial aggregates into the running totals"""
+    if total is None:
+        return part
+    merged = {}
+    for key, reduce_fn in _PARTIAL_REDUCERS.items():
+        if total[key] is None or part[key] is None:
+            merged[key] = part[key] if total[key] is None else total[key]
+        else:
+            merged[key] = reduce_fn(pd.concat([total[key], part[key]]))
+    return merged
+
+
+# ────────────────────────────────────────────────────────────────────────────────────
+
+def _finalize_masterlist_partials(partials, start_date, client_name, has_account, woa_windows=WOA_WINDOWS):
+    """
+    Turn merged partial aggregates into the four per-agent result frames:
+    (df_processed, account_counts, woa_per_agent, ptp_payment_data)
+    """
+    partials = partials or dict.fromkeys(_PARTIAL_REDUCERS)
+
+    # process_masterlist over the pre-aggregated rows (sums of sums are unchanged)
+    agents = partials['agents']
+    df_processed = process_masterlist(agents if agents is not None else pd.DataFrame(), start_date, client_name)
+
+    # Distinct-account counts per agent, in order of first appearance
+    accounts = partials['accounts']
+    if accounts is None:
+        account_counts = pd.DataFrame(columns=['AGENT_USER', 'TOTAL_WOA', 'POSITIVE', 'RPC', 'NEGATIVE'])
+    elif accounts.empty:
+        account_counts = pd.DataFrame()
+    else:
+        grouped = accounts.groupby('AGENT_USER', sort=False)
+        account_counts = pd.DataFrame({
+            'TOTAL_WOA': grouped.size(),
+            'POSITIVE': grouped['POSITIVE'].sum(),
+            'RPC': grouped['RPC'].sum(),
+            'NEGATIVE': grouped['NEGATIVE'].sum(),
+            'FIRST_ROW': grouped['FIRST_ROW'].min()
+        }).sort_values('FIRST_ROW').drop(columns='FIRST_ROW').rename_axis('AGENT_USER').reset_index()
+
+    # WOA row counts per agent
+    woa = partials['woa']
+    if woa is None:
+        woa_per_agent = pd.DataFrame(columns=['AGENT_USER'] + [label for label, _, _ in woa_windows])
+    else:
+        woa_per_agent = woa.sort_index().astype(int).rename_axis('AGENT_USER').reset_index()
+
+    # PTP / payment partial vs settlement breakdown
+    ptp_order = partials['ptp_order']
+    if ptp_order is None or ptp_order.empty:
+        ptp_payment_data = pd.DataFrame()
+    else:
+        agents_in_order = ptp_order.sort_values().index
+        ptp_payment_data = pd.DataFrame({'AGENT_USER': agents_in_order})
+        ptp_payment_data['AGENT_NAME'] = ptp_payment_data['AGENT_USER'].map(AGENT_USER_TO_NAME)
+
+        counts = amounts = pd.DataFrame(0, index=agents_in_order, columns=PTP_CATEGORIES)
+        ptp = partials['ptp']
+        if ptp is not None and not ptp.empty:
+            grouped = ptp.groupby(['AGENT_USER', 'CATEGORY'])
+            # Distinct accounts when an account column exists, otherwise matching rows
+            counts = (grouped.size() if has_account else grouped['ROWS'].sum()).unstack('CATEGORY')
+            amounts = grouped['AMOUNT'].sum().unstack('CATEGORY')
+        counts = counts.reindex(index=agents_in_order, columns=PTP_CATEGORIES).fillna(0).astype(int)
+        amounts = amounts.reindex(index=agents_in_order, columns=PTP_CATEGORIES).fillna(0)
+
+        for category in PTP_CATEGORIES:
+            ptp_payment_data[f'{category}_COUNT'] = counts[category].to_numpy()
+            ptp_payment_data[f'{category}_AMOUNT'] = amounts[category].to_numpy()
+
+    return df_processed, account_counts, woa_per_agent, ptp_payment_data
+
+
+def merge_agent_metrics(df_processed, account_counts, woa_per_agent, ptp_payment_data):
+    """
+    Merge the per-metric frames into one per-agent frame ready for "Add Data to Grid".
+    Metrics that could not be computed (empty frames) are left out so the grid keeps its values.
+    """
+    merged = df_processed
+
+    if not account_counts.empty:
+        # Replace the zero placeholder columns with the real counts
+        merged = merged.drop(columns=[c for c in ['TOTAL_WOA', 'POSITIVE', 'RPC', 'NEGATIVE'] if c in merged.columns])
+        merged = merged.merge(account_counts, on='AGENT_USER', how='left')
+        for col in ['TOTAL_WOA', 'POSITIVE', 'RPC', 'NEGATIVE']:
+            merged[col] = merged[col].fillna(0).astype(int)
+
+    if not woa_per_agent.empty:
+        merged = merged.merge(woa_per_agent, on='AGENT_USER', how='left')
+        for col in woa_per_agent.columns.drop('AGENT_USER'):
+            merged[col] = merged[col].fillna(0).astype(int)
+
+    if not ptp_payment_data.empty:
+        merged = merged.merge(ptp_payment_data.drop(columns=['AGENT_NAME']), on='AGENT_USER', how='left')
+        for category in PTP_CATEGORIES:
+            merged[f'{category}_COUNT'] = merged[f'{category}_COUNT'].fillna(0).astype(int)
+            merged[f'{category}_AMOUNT'] = merged[f'{category}_AMOUNT'].fillna(0)
+
+    return merged
+
+
+# ────────────────────────────────────────────────────────────────────────────────────
+
+def finalize_masterlist(partials, start_date, client_name, has_account, woa_windows=WOA_WINDOWS):
+    """
+    Finalize merged per-agent partials into the MASTERLIST results.
+
+    Returns: (df_agents, account_counts, woa_per_agent, ptp_payment_data) where df_agents is the
+    merged per-agent frame for "Add Data to Grid" and the others are the per-metric summaries.
+    """
+    results = _finalize_masterlist_partials(partials, start_date, client_name, has_account, woa_windows)
+    return (merge_agent_metrics(*results),) + results[1:]
+
+
+def _rewind(source):
+    """Seek file-like uploads back to the start (paths are left untouched)"""
+    if hasattr(source, 'seek'):
+        source.seek(0)
+
+
+def _masterlist_usecols(cols, header):
+    """Only the columns the analytics engine reads for this header layout"""
+    wanted = {c for c in cols.values() if c}
+    wanted.update(c for c in header if c in MASTERLIST_METRIC_COLUMNS)
+    return [c for c in header if c in wanted]
+
+
+def _fold_chunks(chunks, cols, ref_col=None, woa_windows=WOA_WINDOWS, offset=0, row_filter=None):
+    """
+    Fold per-agent partials over an iterable of masterlist chunks, numbering rows from offset.
+    row_filter(chunk, cols), when given, returns a mask of the rows to fold (the rest are skipped
+    before normalization but keep their row numbers).
+    """
+    # One classifier per file, so each distinct status is classified once across all chunks
+    classifier = status_classifier(_ref_status_lists(ref_col))
+    partials = None
+    for chunk in chunks:
+        rows = np.arange(offset, offset + len(chunk))
+        offset += len(chunk)
+        if row_filter is not None:
+            keep = np.asarray(row_filter(chunk, cols), dtype=bool)
+            if not keep.any():
+                continue
+            chunk, rows = chunk[keep], rows[keep]
+        norm = _normalize_masterlist(chunk, cols, classifier, rows)
+        partials = _merge_masterlist_partials(partials, _masterlist_partial(norm, classifier, woa_windows))
+    return partials
+
+
+def _csv_partials(source, ref_col=None, chunksize=MASTERLIST_CHUNK_ROWS, woa_windows=WOA_WINDOWS, offset=0,
+                  row_filter=None):
+    """Stream a CSV in chunks into (partials, has_account)"""
+    header = list(pd.read_csv(source, nrows=0).columns)
+    _rewind(source)
+
+    cols = resolve_columns(header)
+
+    # Read key columns as text so every chunk normalizes them the same way
+    text_cols = {
+        c for c in (cols['agent'], cols['account'], cols['status'])
+        if c
+    }
+
+    with pd.read_csv(
+        source,
+        chunksize=chunksize,
+        usecols=_masterlist_usecols(cols, header),
+        dtype={c: str for c in text_cols}
+    ) as reader:
+        return _fold_chunks(reader, cols, ref_col, woa_windows, offset, row_filter), cols['account'] is not None
+
+
+# ────────────────────────────────────────────────────────────────────────────────────
+
+def _excel_header(values):
+    """Header cells as column names, the way pandas names blank headers"""
+    return [str(v) if v is not None else f"Unnamed: {i}" for i, v in enumerate(values)]
+
+
+def _sheet_frame(values, usecols):
+    """Rows of sheet values as a DataFrame; blank (None) cells become NaN, as pandas' CSV/Excel readers give them"""
+    frame = pd.DataFrame(values, columns=usecols)
+    return frame.where(frame.notna(), np.nan)
+
+
+def _iter_sheet_chunks(rows, header, usecols, chunksize):
+    """Yield DataFrames of the wanted columns from a read-only sheet's row iterator (blank rows skipped)"""
+    positions = [header.index(c) for c in usecols]
+    buffer = []
+    for row in rows:
+        values = [row[i] if i < len(row) else None for i in positions]
+        if all(v is None for v in values):
+            continue
+        buffer.append(values)
+        if len(buffer) >= chunksize:
+            yield _sheet_frame(buffer, usecols)
+            buffer = []
+    if buffer:
+        yield _sheet_frame(buffer, usecols)
+
+
+def _workbook_partials(source, chunksize=MASTERLIST_CHUNK_ROWS, woa_windows=WOA_WINDOWS, offset=0, row_filter=None):
+    """Stream an .xlsx main sheet into (partials, has_account), with REF feeding the status lists"""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(source, read_only=True, data_only=True, keep_links=False)
+    try:
+        sheet_names = workbook.sheetnames
+        ref_name = next((n for n in sheet_names if n.strip().upper() == 'REF'), None)
+        # pick first non-REF sheet as main data (fallback to first sheet)
+        main_name = next((n for n in sheet_names if n != ref_name), sheet_names[0])
+
+        # REF: the status lists live in B33:B44, so a header plus 44 rows is all we need
+        ref_df = None
+        if ref_name is not None:
+            ref_rows = list(workbook[ref_name].iter_rows(max_row=45, values_only=True))
+            if ref_rows:
+                ref_df = _sheet_frame(ref_rows[1:], _excel_header(ref_rows[0]))
+
+        rows = workbook[main_name].iter_rows(values_only=True)
+        header = _excel_header(next(rows, ()))
+        cols = resolve_columns(header)
+        chunks = _iter_sheet_chunks(rows, header, _masterlist_usecols(cols, header), chunksize)
+        return _fold_chunks(chunks, cols, ref_df, woa_windows, offset, row_filter), cols['account'] is not None
+    finally:
+        workbook.close()
+
+
+def _xls_partials(source, woa_windows=WOA_WINDOWS, offset=0, row_filter=None):
+    """Legacy .xls into (partials, has_account): no streaming reader, but only two sheets and the needed columns"""
+    with pd.ExcelFile(source) as workbook:
+        sheet_names = workbook.sheet_names
+        ref_name = next((n for n in sheet_names if n.strip().upper() == 'REF'), None)
+        main_name = next((n for n in sheet_names if n != ref_name), sheet_names[0])
+
+        ref_df = workbook.parse(ref_name, nrows=44) if ref_name is not None else None
+        header = [str(c) for c in workbook.parse(main_name, nrows=0).columns]
+        cols = resolve_columns(header)
+        main_df = workbook.parse(main_name, usecols=_masterlist_usecols(cols, header))
+
+    # One normalization pass feeds every per-agent metric
+    return _fold_chunks([main_df], cols, ref_df, woa_windows, offset, row_filter), cols['account'] is not None
+
+
+def masterlist_file_partials(source, file_name, offset=0, woa_windows=WOA_WINDOWS, row_filter=None):
+    """
+    Read one MASTERLIST (CSV or Excel) into per-agent partials: (partials, has_account).
+    For workbooks the first non-REF sheet is the data and REF feeds the status lists.
+    row_filter is passed to _fold_chunks (e.g. to skip rows ingested by an earlier upload).
+    """
+    _rewind(source)
+    file_name = file_name.lower()
+    if file_name.endswith(".csv"):
+        # Stream CSVs in fixed-size chunks; per-agent partials are merged at the end
+        return _csv_partials(source, woa_windows=woa_windows, offset=offset, row_filter=row_filter)
+
+    if file_name.endswith(".xlsx"):
+        # Stream only the main and REF sheets
+        return _workbook_partials(source, woa_windows=woa_windows, offset=offset, row_filter=row_filter)
+
+    return _xls_partials(source, woa_windows, offset, row_filter)
+
+
+# ────────────────────────────────────────────────────────────────────────────────────
+
+# Rows of the n-th file in a multi-file upload are numbered from n * this, so "first appearance"
+# (account and PTP agent order) follows file order, then row order
+MASTERLIST_FILE_ROW_STRIDE = 10 ** 12
+
+
+def _timed_file_partials(source, index, row_filter=None):
+    """Worker: partials for the index-th file of a multi-file upload, with its processing time"""
+    started = time.perf_counter()
+    file_name = getattr(source, 'name', None) or os.path.basename(source)
+    partials, has_account = masterlist_file_partials(
+        source, file_name, offset=index * MASTERLIST_FILE_ROW_STRIDE, row_filter=row_filter
+    )
+    return partials, has_account, time.perf_counter() - started
+
+
+def reduce_file_partials(parts):
+    """
+    Merge per-file (partials, has_account, seconds) results in file order into (partials, has_account).
+    PTP counts are distinct accounts only when every file has an account column.
+    """
+    partials = functools.reduce(_merge_masterlist_partials, (part[0] for part in parts if part[0] is not None), None)
+    return partials, all(part[1] for part in parts)
+
+
+def _masterlist_worker_init(overrides):
+    """Process pool initializer: use the parent's column overrides"""
+    global _worker_column_overrides
+    _worker_column_overrides = overrides
+
+
+def _file_partials_job(source, file_name, index, seen=None):
+    """
+    Worker: _timed_file_partials for the index-th file of an upload, streamed from its path or
+    upload buffer, or read from its bytes. With `seen` (fingerprint counts ingested before, see _unseen_rows) only
+    unseen rows are folded. Returns (partials, has_account, seconds, tally).
+    """
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+        source.name = file_name
+    tally = {"counts": pd.Series(dtype='int64'), "new": 0, "rows": 0}
+    row_filter = None if seen is None else _unseen_rows(seen, tally)
+    return _timed_file_partials(source, index, row_filter) + (tally,)
+
+
+def map_masterlist_files(sources, seen=None, max_workers=None, indexes=None):
+    """
+    Run _file_partials_job for each uploaded file (or path). A single file is streamed in-process
+    from its upload buffer or path; several go to a process pool, since parsing and folding are
+    mostly pure-Python work that holds the GIL. `seen` lists each file's fingerprint counts, or is
+    None to fold every row; `indexes` are the files' positions in the upload (default: their order here).
+    """
+    names = [getattr(source, 'name', None) or os.path.basename(source) for source in sources]
+    seen = seen or [None] * len(sources)
+    indexes = indexes or list(range(len(sources)))
+    if len(sources) == 1:
+        return [_file_partials_job(sources[0], names[0], indexes[0], seen[0])]
+
+    # Paths go to the workers as-is and are streamed from disk; uploads are already in memory.
+    # Workers are spawned, not forked: forking the threaded Streamlit server can deadlock.
+    payloads = [source.getvalue() if hasattr(source, 'getvalue') else source for source in sources]
+    with ProcessPoolExecutor(max_workers=max_workers or min(len(sources), os.cpu_count() or 1),
+                             mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_masterlist_worker_init, initargs=(column_overrides(),)) as pool:
+        return list(pool.map(_file_partials_job, payloads, names, indexes, seen))
+
+
+# ┌─────────────────────────────────────────────────────────────────────────────────┐
+# │            UPLOAD RESULT CACHE                               │
+# └─────────────────────────────────────────────────────────────────────────────────┘
+
+# Per-session LRU budget for processed uploads
+UPLOAD_CACHE_MAX_ENTRIES = 8
+UPLOAD_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+
+def upload_cache_key(uploaded_files, client_name, start_date):
+    """Key processed results by the files' contents (not names), client, START_DATE and column overrides"""
+    digests = tuple(hashlib.sha256(f.getvalue()).hexdigest() for f in uploaded_files)
+    return (digests, client_name, str(start_date), column_overrides())
+
+
+def _results_nbytes(results):
+    return int(sum(frame.memory_usage(index=True, deep=True).sum() for frame in results))
+
+
+def get_cached_upload(key):
+    """Return cached results for key (marking them most recently used), or None"""
+    cache = st.session_state.upload_cache
+    entry = cache.get(key)
+    if entry is None:
+        return None
+    cache.move_to_end(key)
+    return entry[0]
+
+
+def cache_upload_results(key, results):
+    """Store results, evicting least recently used entries past the entry/byte budget"""
+    cache = st.session_state.upload_cache
+    nbytes = _results_nbytes(results)
+    if nbytes > UPLOAD_CACHE_MAX_BYTES:
+        return
+
+    cache[key] = (results, nbytes)
+    cache.move_to_end(key)
+    total = sum(size for _, size in cache.values())
+    while len(cache) > UPLOAD_CACHE_MAX_ENTRIES or total > UPLOAD_CACHE_MAX_BYTES:
+        _, (_, evicted) = cache.popitem(last=False)
+        total -= evicted
+
+
+# ┌─────────────────────────────────────────────────────────────────────────────────┐
+# │            INCREMENTAL MASTERLIST INGEST                     │
+# └─────────────────────────────────────────────────────────────────────────────────┘
+
+# Days (client, START_DATE, column overrides) whose ingested rows are remembered for re-uploads
+INGEST_MAX_DAYS = 8
+
+# Roles whose values identify a remark row
+FINGERPRINT_ROLES = ('account', 'agent', 'status', 'time')
+
+
+@st.cache_resource(show_spinner=False)
+def ingest_state():
+    """
+    Process-wide state for re-uploads of a growing daily masterlist. Per day it keeps, for each file
+    of the last upload (by position and name), how many times each row fingerprint was ingested,
+    plus the per-agent partials of those rows; the partials hold the distinct (agent, account)
+    pairs, so account counts stay exact.
+    """
+    return {"lock": threading.Lock(), "days": OrderedDict()}
+
+
+def row_fingerprints(chunk, cols):
+    """uint64 fingerprint per row from its account, REMARK BY, status and time values"""
+    keys = [cols[role] for role in FINGERPRINT_ROLES if cols[role]]
+    if not keys:
+        return pd.Series(np.zeros(len(chunk), dtype='uint64'), index=chunk.index)
+    return pd.util.hash_pandas_object(chunk[keys].astype(str), index=False)
+
+
+def _unseen_rows(seen, tally):
+    """
+    Row filter for _fold_chunks. Identical rows are counted: the k-th occurrence of a fingerprint
+    in the file is new once k reaches the number already ingested. The file's fingerprint counts
+    and new-row total are added to `tally`.
+    """
+    def row_filter(chunk, cols):
+        fingerprints = row_fingerprints(chunk, cols)
+        earlier = tally["counts"].reindex(fingerprints).fillna(0).to_numpy()
+        occurrence = fingerprints.groupby(fingerprints).cumcount().to_numpy() + earlier
+        keep = occurrence >= seen.reindex(fingerprints).fillna(0).to_numpy()
+        tally["counts"] = tally["counts"].add(fingerprints.value_counts(), fill_value=0)
+        tally["new"] += int(keep.sum())
+        tally["rows"] += len(chunk)
+        return keep
+
+    return row_filter
+
+
+def ingest_masterlist_files(sources, start_date, client_name, max_workers=None):
+    """
+    Map-reduce a day's MASTERLIST upload (one or more files, e.g. one export per team) into one
+    finalize_masterlist tuple, incrementally across re-uploads of the same day's masterlist(s).
+    An account seen in several files is counted once and WOA/amount sums add up.
+    Only rows whose (account, REMARK BY, status, time) fingerprint was not ingested before from a
+    file of the same name and position in the last upload for this client and day are normalized
+    and folded into that file's partials. The result merges the partials of the files in this
+    upload only, and only they are kept, so a file dropped from the uploader no longer counts.
+    A renamed, moved, re-added or replaced file (one missing rows ingested from it before) is
+    processed from scratch (see also reset_ingest).
+
+    Returns (finalize_masterlist tuple, new rows, total rows).
+    """
+    # State is per client, day and override set; the shared lock only guards reading and storing
+    # it, so parsing runs unlocked and uploads for other days (or other sessions) never wait on it
+    key = (client_name, str(start_date), column_overrides())
+    state = ingest_state()
+    with state["lock"]:
+        previous_files = state["days"].get(key) or {}
+
+    # Keyed by position too: row numbers (first appearance) depend on the file's place in the upload
+    file_keys = [
+        (index, getattr(source, 'name', None) or os.path.basename(source))
+        for index, source in enumerate(sources)
+    ]
+    known = [previous_files.get(file_key) for file_key in file_keys]
+    empty = pd.Series(dtype='int64')
+    parts = map_masterlist_files(sources, [f["seen"] if f else empty for f in known], max_workers)
+
+    # A file that no longer holds every row ingested from it was replaced, not grown: start it over
+    replaced = [
+        index for index, (previous, part) in enumerate(zip(known, parts))
+        if previous is not None and
+        (part[3]["counts"].reindex(previous["seen"].index).fillna(0) < previous["seen"]).any()
+    ]
+    if replaced:
+        redone = map_masterlist_files([sources[i] for i in replaced], [empty] * len(replaced), max_workers, replaced)
+        for index, part in zip(replaced, redone):
+            known[index], parts[index] = None, part
+
+    files = {}
+    for file_key, previous, part in zip(file_keys, known, parts):
+        counts = part[3]["counts"]
+        if previous is None:
+            partials, has_account, seen = part[0], part[1], counts
+        else:
+            partials, has_account = reduce_file_partials([(previous["partials"], previous["has_account"]), part])
+            seen = previous["seen"]
+            if seen.empty:
+                seen = counts
+            elif not counts.empty:
+                seen = pd.concat([seen, counts]).groupby(level=0).max()
+        files[file_key] = {"seen": seen.astype('int64'), "partials": partials, "has_account": has_account}
+
+    # The last upload for the day wins; stored file states are never modified in place
+    with state["lock"]:
+        state["days"][key] = files
+        state["days"].move_to_end(key)
+        while len(state["days"]) > INGEST_MAX_DAYS:
+            state["days"].popitem(last=False)
+
+    partials, has_account = reduce_file_partials([(f["partials"], f["has_account"]) for f in files.values()])
+    results = finalize_masterlist(partials, start_date, client_name, has_account)
+    tallies = [part[3] for part in parts]
+    return results, sum(t["new"] for t in tallies), sum(t["rows"] for t in tallies)
+
+
+def reset_ingest(client_name, start_date):
+    """Forget a day's ingested rows so the next upload is processed from scratch"""
+    state = ingest_state()
+    with state["lock"]:
+        for key in [k for k in state["days"] if k[:2] == (client_name, str(start_date))]:
+            del state["days"][key]
+
+
+# ┌─────────────────────────────────────────────────────────────────────────────────┐
+# │            PERSISTENT DATA STORE                             │
+# └─────────────────────────────────────────────────────────────────────────────────┘
+
+# SQLite file holding enbd_data / eib_data and the per-client payment, PTP and target tables.
+# Each table is keyed by row_id, which is also the DataFrame index of the in-memory copy.
+DATA_STORE_PATH = os.environ.get(
+    "DASHBOARD_DATA_STORE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "dashboard.sqlite3")
+)
+
+# Declared column types for the sheets, applied when rows are written or loaded so readers
+# never re-parse: "float" amounts, "int" (nullable), "datetime" dates, "category" for
+# low-cardinality labels; "text" columns are kept as entered.
+PAYMENT_SCHEMA = {
+    'AGREEMENT NO': 'text', 'AGREEMENT ID': 'text', 'CIF NO': 'text', 'RELATIONSHIP NO': 'text',
+    'TOUCHED POINTS': 'text', 'OFFICIAL AGENT': 'category', 'CM NAME': 'text', 'PRODUCTS CAT': 'category',
+    'VINTAGE': 'category', 'PAYMENT STATUS': 'category', 'DATE': 'datetime', 'POSTED AED': 'float',
+    'POSTED PH': 'float', 'CF %': 'text', 'CF AMT': 'float', 'MONTH': 'text'
+}
+
+PTP_SCHEMA = {
+    'AGREEMENT NO': 'text', 'AGREEMENT ID': 'text', 'CUSTOMER NO': 'text', 'RELATIONSHIP NO': 'text',
+    'AGENT': 'category', 'CM NAME': 'text', 'PRODUCTS CAT': 'category', 'VINTAGE': 'category',
+    'STATUS': 'category', 'DATE': 'datetime', 'MONTH': 'text', 'PTP AMOUNT': 'float',
+    'STATUS TODAY': 'category', 'BROKEN AMOUNT': 'float'
+}
+
+TARGET_SCHEMA = {'Year': 'int', 'Month': 'int', 'Target AED': 'float'}
+
+PAYMENT_COLUMNS = list(PAYMENT_SCHEMA)
+PTP_COLUMNS = list(PTP_SCHEMA)
+TARGET_COLUMNS = list(TARGET_SCHEMA)
+
+TABLE_SCHEMAS = {"_payment_data": PAYMENT_SCHEMA, "_ptp_data": PTP_SCHEMA, "_target_data": TARGET_SCHEMA}
+
+
+def _by_key_suffix(mapping, key):
+    for suffix, value in mapping.items():
+        if key.endswith(suffix):
+            return value
+    return None
+
+
+def apply_schema(df, schema):
+    """Cast a frame's schema columns to their declared dtypes; unparseable values become NaN/NaT"""
+    if not schema:
+        return df
+    df = df.copy()
+    for col, kind in schema.items():
+        if col not in df.columns:
+            continue
+        values = df[col]
+        if kind == 'float' and values.dtype != 'float64':
+            df[col] = parse_amounts(values)
+        elif kind == 'int' and values.dtype != 'Int64':
+            df[col] = pd.to_numeric(values, errors='coerce').round().astype('Int64')
+        elif kind == 'datetime' and not pd.api.types.is_datetime64_any_dtype(values):
+            df[col] = pd.to_datetime(values, errors='coerce')
+        elif kind == 'category' and not isinstance(values.dtype, pd.CategoricalDtype):
+            df[col] = values.mask(values.astype(str).str.strip() == '').astype('category')
+    return df
+
+
+def _union_categories(*frames):
+    """Give the frames' shared categorical columns the same categories so concat/assignment keep the dtype"""
+    frames = [frame.copy() for frame in frames]
+    for col in frames[0].columns:
+        if not all(col in frame.columns and isinstance(frame[col].dtype, pd.CategoricalDtype) for frame in frames):
+            continue
+        categories = frames[0][col].cat.categories
+        for frame in frames[1:]:
+            categories = categories.union(frame[col].cat.categories)
+        for frame in frames:
+            frame[col] = frame[col].cat.set_categories(categories)
+    return frames
+
+
+def _store_connect():
+    os.makedirs(os.path.dirname(DATA_STORE_PATH), exist_ok=True)
+    con = sqlite3.connect(DATA_STORE_PATH, timeout=30)
+    con.execute("PRAGMA journal_mode=WAL")
+    return con
+
+
+def _quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _sql_value(value):
+    """Convert a cell to something SQLite stores natively (dates as ISO text, NaN/NaT as NULL)"""
+    if value is None or (pd.api.types.is_scalar(value) and pd.isna(value)):
+        return None
+    if isinstance(value, dt):
+        value = pd.Timestamp(value)
+        return value.date().isoformat() if value == value.normalize() else value.isoformat()
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _table_columns(con, table):
+    return [row[1] for row in con.execute(f"PRAGMA table_info({_quote(table)})")]
+
+
+def _ensure_table(con, table, columns):
+    """Create the table on first write and add any columns it does not have yet"""
+    existing = _table_columns(con, table)
+    if not existing:
+        con.execute(f"CREATE TABLE IF NOT EXISTS {_quote(table)} (row_id INTEGER PRIMARY KEY AUTOINCREMENT)")
+        existing = ['row_id']
+    for col in columns:
+        if col not in existing:
+            con.execute(f"ALTER TABLE {_quote(table)} ADD COLUMN {_quote(col)}")
+
+
+def store_load_table(table):
+    """Load a persisted table indexed by row_id, or None when it has never been written"""
+    with closing(_store_connect()) as con:
+        if not _table_columns(con, table):
+            return None
+        df = pd.read_sql_query(f"SELECT * FROM {_quote(table)} ORDER BY row_id", con, index_col='row_id')
+    df.index.name = None
+    return df
+
+
+def store_insert_rows(table, rows):
+    """Append rows and return them re-indexed by their new row_ids"""
+    rows = rows.reset_index(drop=True)
+    columns = list(rows.columns)
+    with closing(_store_connect()) as con, con:
+        _ensure_table(con, table, columns)
+        if columns:
+            sql = (f"INSERT INTO {_quote(table)} ({', '.join(_quote(c) for c in columns)}) "
+                   f"VALUES ({', '.join('?' * len(columns))})")
+        else:
+            sql = f"INSERT INTO {_quote(table)} DEFAULT VALUES"
+        row_ids = [
+            con.execute(sql, [_sql_value(v) for v in values]).lastrowid
+            for values in rows.itertuples(index=False, name=None)
+        ]
+    rows.index = pd.Index(row_ids)
+    return rows
+
+
+def store_update_rows(table, rows):
+    """Write changed rows back by row_id (the frame index); only the given columns are touched"""
+    if rows.empty:
+        return
+    columns = list(rows.columns)
+    with closing(_store_connect()) as con, con:
+        _ensure_table(con, table, columns)
+        con.executemany(
+            f"UPDATE {_quote(table)} SET {', '.join(f'{_quote(c)} = ?' for c in columns)} WHERE row_id = ?",
+            [
+                [_sql_value(v) for v in values] + [int(row_id)]
+                for row_id, values in zip(rows.index, rows.itertuples(index=False, name=None))
+            ]
+        )
+
+
+def store_delete_rows(table, row_ids):
+    """Delete rows by row_id"""
+    with closing(_store_connect()) as con, con:
+        if _table_columns(con, table):
+            con.executemany(f"DELETE FROM {_quote(table)} WHERE row_id = ?", [(int(i),) for i in row_ids])
+
+
+# ────────────────────────────────────────────────────────────────────────────────────
+
+@st.cache_resource(show_spinner=False)
+def shared_tables():
+    """
+    Process-wide registry of client tables shared by every session.
+    Frames are treated as immutable: writers build a new frame and swap it in under the lock
+    (copy-on-write), bumping the table's version so readers can key caches on it.
+    Appended rows wait in a per-table buffer until a reader needs the full frame.
+    """
+    return {"lock": threading.RLock(), "frames": {}, "versions": {}, "rollups": {}, "buffers": {}}
+
+
+def _load_table(key, columns=()):
+    """Load a table into the registry if it is not there yet (caller holds the lock)"""
+    registry = shared_tables()
+    if key not in registry["frames"]:
+        frame = store_load_table(key)
+        if frame is None:
+            frame = pd.DataFrame(columns=list(columns))
+        registry["frames"][key] = apply_schema(frame, _by_key_suffix(TABLE_SCHEMAS, key))
+        registry["versions"].setdefault(key, 0)
+
+
+def _compact_table(key):
+    """Materialize buffered appends into the table's frame with a single concat (caller holds the lock)"""
+    registry = shared_tables()
+    buffered = registry["buffers"].pop(key, None)
+    if not buffered:
+        return
+    frames = [frame for frame in [registry["frames"][key]] + buffered if not frame.empty]
+    if frames:
+        registry["frames"][key] = pd.concat(_union_categories(*frames))
+
+
+def get_table(key, columns=()):
+    """
+    Shared copy of a client table, loaded from the store on first access.
+    Tables that were never saved start empty with the given columns. Do not modify in place.
+    """
+    registry = shared_tables()
+    frame = registry["frames"].get(key)
+    if frame is None or registry["buffers"].get(key):
+        with registry["lock"]:
+            _load_table(key, columns)
+            _compact_table(key)
+            frame = registry["frames"][key]
+    return frame
+
+
+def load_table(key, columns=()):
+    """
+    Load a table into the shared registry without compacting its buffered appends, for readers
+    that only need its columns, rollups or table_stats. Returns the frame without the buffered rows.
+    """
+    registry = shared_tables()
+    if key not in registry["frames"]:
+        with registry["lock"]:
+            _load_table(key, columns)
+    return registry["frames"][key]
+
+
+def table_stats(key, amount_col):
+    """Row count and amount total of a table, read from its frame and buffered appends without compacting"""
+    registry = shared_tables()
+    with registry["lock"]:
+        _load_table(key)
+        parts = [registry["frames"][key]] + registry["buffers"].get(key, [])
+    rows = sum(len(part) for part in parts)
+    total = sum(float(part[amount_col].sum()) for part in parts if amount_col in part.columns)
+    return rows, total
+
+
+def table_version(key):
+    """Number of writes applied to a shared table since the process started"""
+    return shared_tables()["versions"].get(key, 0)
+
+
+def set_table(key, df):
+    """Swap in a new shared frame for a table (callers persist the rows they changed)"""
+    registry = shared_tables()
+    with registry["lock"]:
+        current = registry["frames"].get(key)
+        if current is not None and current.equals(df):
+            return
+        registry["buffers"].pop(key, None)
+        _swap_table(key, df)
+        registry["rollups"].pop(key, None)
+
+
+def reload_table(key):
+    """Drop a table's shared copy so the next reader reloads it (picks up rows written by other processes)"""
+    registry = shared_tables()
+    with registry["lock"]:
+        registry["frames"].pop(key, None)
+        registry["buffers"].pop(key, None)
+        registry["rollups"].pop(key, None)
+        _bump_version(key)
+
+
+def _swap_table(key, df):
+    registry = shared_tables()
+    registry["frames"][key] = df
+    _bump_version(key)
+
+
+def _bump_version(key):
+    versions = shared_tables()["versions"]
+    versions[key] = versions.get(key, 0) + 1
+
+
+# Buffered appends are compacted once this many rows are waiting, even if nobody reads the table.
+APPEND_BUFFER_MAX_ROWS = 1000
+
+
+def append_rows(key, rows):
+    """
+    Persist new rows and buffer them for the shared table. The buffer is compacted into the
+    frame when a reader asks for it or once APPEND_BUFFER_MAX_ROWS rows are waiting, so
+    single-row adds do not copy the whole table.
+    """
+    registry = shared_tables()
+    with registry["lock"]:
+        _load_table(key)
+        rows = store_insert_rows(key, apply_schema(rows, _by_key_suffix(TABLE_SCHEMAS, key)))
+        _adjust_rollup(key, rows, 1)
+        buffered = registry["buffers"].setdefault(key, [])
+        buffered.append(rows)
+        _bump_version(key)
+        if sum(len(frame) for frame in buffered) >= APPEND_BUFFER_MAX_ROWS:
+            _compact_table(key)
+    return rows
+
+
+def update_rows(key, rows):
+    """Persist changed rows (indexed by row_id) and apply them to the shared table"""
+    if rows.empty:
+        return
+    with shared_tables()["lock"]:
+        rows = apply_schema(rows, _by_key_suffix(TABLE_SCHEMAS, key))
+        current = get_table(key)
+        updated, rows = _union_categories(current, rows)
+        store_update_rows(key, rows)
+        for col in rows.columns:
+            if col not in updated.columns:
+                updated[col] = None
+        updated.loc[rows.index, rows.columns] = rows
+        _adjust_rollup(key, current.loc[rows.index], -1)
+        _adjust_rollup(key, updated.loc[rows.index], 1)
+        _swap_table(key, updated)
+
+
+def delete_rows(key, row_ids):
+    """Delete rows by row_id from the store and the shared table"""
+    with shared_tables()["lock"]:
+        current = get_table(key)
+        store_delete_rows(key, row_ids)
+        _adjust_rollup(key, current.loc[list(row_ids)], -1)
+        _swap_table(key, current.drop(index=list(row_ids)))
+
+
+# ────────────────────────────────────────────────────────────────────────────────────
+
+# Payment and PTP tables keep daily rollups of their amount column so the dashboard's date
+# range views read O(days) aggregates instead of scanning every row.
+ROLLUP_AMOUNT_COLUMNS = {"_payment_data": "POSTED AED", "_ptp_data": "PTP AMOUNT"}
+ROLLUP_COLUMNS = ['AMOUNT', 'COUNT', 'ROWS']
+
+
+def daily_rollup(frame, amount_col):
+    """
+    Per-day AMOUNT (sum), COUNT (non-empty amounts) and ROWS of a typed payment/PTP frame,
+    indexed by DATE. Rows without a DATE are left out, as in the dashboard filters.
+    """
+    if frame.empty or "DATE" not in frame.columns or amount_col not in frame.columns:
+        return pd.DataFrame({col: pd.Series(dtype=float) for col in ROLLUP_COLUMNS}, index=pd.DatetimeIndex([]))
+    amounts = frame[amount_col]
+    parts = pd.DataFrame({
+        'AMOUNT': amounts.fillna(0),
+        'COUNT': amounts.notna().astype(int),
+        'ROWS': 1
+    }, index=frame.index)
+    return parts.groupby(frame["DATE"].dt.normalize()).sum()
+
+
+def _adjust_rollup(key, rows, sign):
+    """Fold added (sign=1) or removed (sign=-1) rows into a cached daily rollup (caller holds the lock)"""
+    rollups = shared_tables()["rollups"]
+    amount_col = _by_key_suffix(ROLLUP_AMOUNT_COLUMNS, key)
+    if key not in rollups or amount_col is None or rows.empty:
+        return
+    daily = rollups[key]["D"].add(daily_rollup(rows, amount_col) * sign, fill_value=0)
+    rollups[key] = {"D": daily[daily['ROWS'] > 0].sort_index()}
+
+
+def get_rollup(key, level="D"):
+    """Daily rollup of a payment/PTP table; level "M" or "Y" gives month/year rollups derived from it"""
+    registry = shared_tables()
+    with registry["lock"]:
+        rollup = registry["rollups"].get(key)
+        if rollup is None:
+            rollup = {"D": daily_rollup(get_table(key), _by_key_suffix(ROLLUP_AMOUNT_COLUMNS, key))}
+            registry["rollups"][key] = rollup
+        if level not in rollup:
+            daily = rollup["D"]
+            rollup[level] = daily.groupby(daily.index.to_period(level)).sum()
+        return rollup[level]
+
+
+def period_rollup(key, range_type, selected_date):
+    """
+    Totals and per-day rollup rows of a payment/PTP table for the "Specific Date", "By Month"
+    or "By Year" selection.
+    """
+    day = pd.Timestamp(selected_date)
+    if range_type == "Specific Date":
+        level, start, end = "D", day, day
+    elif range_type == "By Month":
+        level, start, end = "M", day.replace(day=1), day + pd.offsets.MonthEnd(0)
+    else:  # By Year
+        level, start, end = "Y", day.replace(month=1, day=1), day.replace(month=12, day=31)
+
+    daily = get_rollup(key)
+    table = daily if level == "D" else get_rollup(key, level)
+    period = day if level == "D" else day.to_period(level)
+    totals = table.loc[period] if period in table.index else pd.Series(0.0, index=ROLLUP_COLUMNS)
+    return totals, daily.loc[start:end]
+
+
+def changed_rows(before, after):
+    """Rows of `after` whose values differ from `before` (aligned on index and columns)"""
+    before = before.reindex(index=after.index, columns=after.columns)
+    same = (after == before) | (after.isna() & before.isna())
+    return after[~same.all(axis=1)]
+
+
+# ┌─────────────────────────────────────────────────────────────────────────────────┐
+# │                  SHEET BULK IMPORT                            │
+# └─────────────────────────────────────────────────────────────────────────────────┘
+
+# Payment and PTP rows are unique per agreement and date; importing a row with an existing
+# key updates that row instead of adding a duplicate.
+IMPORT_KEY_COLUMNS = ['AGREEMENT NO', 'DATE']
+
+
+def _normalize_header(name):
+    return ' '.join(str(name).replace('_', ' ').split()).upper()
+
+
+def read_import_file(uploaded_file):
+    """Read an uploaded CSV/Excel sheet with every cell as text (keeps leading zeros in IDs)"""
+    if uploaded_file.name.lower().endswith('.csv'):
+        return pd.read_csv(uploaded_file, dtype=str)
+    return pd.read_excel(uploaded_file, dtype=str)
+
+
+def guess_import_mapping(columns, schema):
+    """Map schema columns to file columns whose headers match ignoring case, spacing and underscores"""
+    by_header = {_normalize_header(col): col for col in columns}
+    return {col: by_header[_normalize_header(col)] for col in schema if _normalize_header(col) in by_header}
+
+
+def _blank(values):
+    return values.isna() | (values.astype(str).str.strip() == '')
+
+
+def import_sheet_rows(key, raw, mapping, schema):
+    """
+    Validate, deduplicate and upsert file rows into a payment/PTP table.
+    `mapping` maps schema columns to file columns. Rows without an AGREEMENT NO, with an
+    unparseable DATE or with an unparseable amount are rejected; duplicate keys within the
+    file keep their last row. Returns a summary dict with the rejected rows and their reasons.
+    """
+    missing = [col for col in IMPORT_KEY_COLUMNS if col not in mapping]
+    if missing:
+        raise ValueError(f"Map a file column to {', '.join(missing)} before importing")
+
+    mapped = pd.DataFrame({col: raw[file_col] for col, file_col in mapping.items()}, index=raw.index)
+    mapped['AGREEMENT NO'] = mapped['AGREEMENT NO'].astype(str).str.strip().mask(_blank(mapped['AGREEMENT NO']))
+    typed = apply_schema(mapped, schema)
+
+    checks = {
+        "missing AGREEMENT NO": typed['AGREEMENT NO'].isna(),
+        "invalid DATE": typed['DATE'].isna()
+    }
+    for col, kind in schema.items():
+        if kind in ('float', 'int', 'datetime') and col in mapping and col != 'DATE':
+            checks[f"invalid {col}"] = typed[col].isna() & ~_blank(mapped[col])
+    reason = pd.Series('', index=typed.index)
+    for label, failed in checks.items():
+        reason = reason.mask(failed, reason + label + '; ')
+    rejected_mask = reason != ''
+
+    valid = typed[~rejected_mask]
+    deduped = valid.drop_duplicates(IMPORT_KEY_COLUMNS, keep='last').copy()
+    # Labels seen only in rejected or superseded rows must not reach the stored categories
+    for col in deduped.columns:
+        if isinstance(deduped[col].dtype, pd.CategoricalDtype):
+            deduped[col] = deduped[col].cat.remove_unused_categories()
+
+    existing = get_table(key)
+    existing_keys = pd.DataFrame({
+        'AGREEMENT NO': existing['AGREEMENT NO'].astype(str).str.strip(),
+        'DATE': existing['DATE'],
+        'ROW_ID': existing.index
+    }).dropna(subset=['DATE']).drop_duplicates(IMPORT_KEY_COLUMNS, keep='last')
+    row_ids = deduped[IMPORT_KEY_COLUMNS].merge(existing_keys, on=IMPORT_KEY_COLUMNS, how='left')['ROW_ID'].to_numpy()
+    matched = pd.notna(row_ids)
+
+    updates = deduped[matched].copy()
+    updates.index = pd.Index(row_ids[matched].astype(int))
+    inserts = deduped[~matched].reindex(columns=list(schema))
+
+    update_rows(key, updates)
+    if not inserts.empty:
+        append_rows(key, inserts)
+
+    rejected = raw[rejected_mask].copy()
+    rejected.insert(0, 'REASON', reason[rejected_mask].str.rstrip('; '))
+    return {
+        'inserted': len(inserts),
+        'updated': len(updates),
+        'duplicates': len(valid) - len(deduped),
+        'rejected': len(rejected),
+        'rejected_rows': rejected
+    }
 
 
 # ┌─────────────────────────────────────────────────────────────────────────────────┐
@@ -835,25 +2128,209 @@ def get_default_data_for_client(client_name, start_date):
             "START_DATE": start_date
         })
 
-    return pd.DataFrame(rows)
+    return pd.DataFrame(rows)
+
+
+# Metric columns "Add Data to Grid" copies from an uploaded masterlist into the grid
+GRID_METRIC_COLUMNS = [
+    'TOTAL_WOA (5pm)', 'TOTAL_WOA (9pm)', 'TOTAL_WOA', 'POSITIVE', 'RPC', 'NEGATIVE',
+    'PTP_PAYMENT_COUNT', 'PTP_PAYMENT_AMOUNT', 'PTP_PARTIAL_COUNT', 'PTP_PARTIAL_AMOUNT',
+    'PAYMENT_PARTIAL_COUNT', 'PAYMENT_PARTIAL_AMOUNT', 'PTP_SETTLEMENT_COUNT', 'PTP_SETTLEMENT_AMOUNT',
+    'PAYMENT_SETTLEMENT_COUNT', 'PAYMENT_SETTLEMENT_AMOUNT'
+]
+
+# Metrics stored as whole numbers (everything but the *_AMOUNT sums)
+GRID_COUNT_COLUMNS = [col for col in GRID_METRIC_COLUMNS if not col.endswith('_AMOUNT')]
+
+
+def _integer_counts(frame):
+    """Cast a grid frame's count metrics back to integers (nullable where a value is missing)"""
+    frame = frame.copy()
+    for col in GRID_COUNT_COLUMNS:
+        if col in frame.columns:
+            values = pd.to_numeric(frame[col], errors='coerce')
+            frame[col] = values.astype(int) if values.notna().all() else values.round().astype('Int64')
+    return frame
+
+
+def upsert_agent_metrics(grid_key, df_processed, client_name, start_date):
+    """
+    Upsert uploaded per-agent metrics into a client grid keyed on (AGENT_USER, START_DATE).
+    Agents that already have a row for the date get their non-null metrics overwritten; the
+    rest are inserted. A date with no rows yet is seeded with the client's default agents.
+    Returns (updated, inserted) row counts.
+    """
+    grid = get_table(grid_key)
+    processed = df_processed.drop_duplicates('AGENT_USER', keep='last').set_index('AGENT_USER')
+    metrics = [col for col in GRID_METRIC_COLUMNS if col in processed.columns]
+
+    # Row ids of the grid rows already holding this date, by agent
+    if grid.empty:
+        on_day = pd.Series(dtype='int64')
+    else:
+        grid_dates = pd.to_datetime(grid['START_DATE'], errors='coerce').dt.normalize()
+        on_day = pd.Series(grid.index, index=grid['AGENT_USER'])[
+            (grid_dates == pd.Timestamp(start_date)).to_numpy()
+        ]
+        on_day = on_day[~on_day.index.duplicated()]
+
+    # Update: uploaded values win where present, existing values stay where not
+    matched = processed.index.intersection(on_day.index)
+    if len(matched):
+        current = grid.loc[on_day[matched].to_numpy()].reindex(columns=metrics)
+        uploaded = processed.loc[matched, metrics].set_axis(current.index)
+        # combine_first upcasts to float; counts are written back as integers
+        updates = _integer_counts(uploaded.combine_first(current)[metrics])
+        update_rows(grid_key, changed_rows(grid, updates))
+
+    # Insert: seeded defaults for a new date plus uploaded agents that have no row yet
+    if on_day.empty:
+        defaults = get_default_data_for_client(client_name, start_date).set_index('AGENT_USER')
+        extra = processed.index.difference(defaults.index)
+        inserts = pd.concat([defaults, processed.loc[extra]]) if len(extra) else defaults
+    else:
+        inserts = processed.loc[processed.index.difference(on_day.index)].copy()
+    overlay = processed.reindex(inserts.index)[metrics]
+    inserts[metrics] = overlay.combine_first(inserts[metrics])[metrics]
+    inserts['START_DATE'] = start_date
+    inserts = _integer_counts(inserts.reset_index())
+    if not inserts.empty:
+        append_rows(grid_key, inserts)
+    return len(matched), len(inserts)
+
+
+# ────────────────────────────────────────────────────────────────────────────────────
+
+def period_target(client_name, range_type, selected_date):
+    """Collection target for a date range: the month's target, or the year's average (default 100,000)"""
+    target_value = 100000  # Default
+    target_data = get_table(f"{client_name}_target_data", TARGET_COLUMNS)
+    if target_data.empty:
+        return target_value
+
+    # Year, Month and Target AED are typed by TARGET_SCHEMA
+    if range_type == "Specific Date" or range_type == "By Month":
+        # Find target for this year and month
+        matching_target = target_data[
+            (target_data['Year'] == selected_date.year) &
+            (target_data['Month'] == selected_date.month)
+        ]
+        if not matching_target.empty:
+            target_value = float(matching_target.iloc[0]['Target AED'])
+    elif range_type == "By Year":
+        # Average targets for the year
+        year_targets = target_data[target_data['Year'] == selected_date.year]
+        if not year_targets.empty:
+            target_value = float(year_targets['Target AED'].mean())
+    return target_value
+
+
+# Time-series resolution by the span of the plotted data: daily points up to CHART_DAILY_MAX_DAYS,
+# weekly sums beyond (the widest range, By Year, is at most 53 weeks)
+CHART_DAILY_MAX_DAYS = 93
+
+
+def downsample_rollup(daily):
+    """
+    Aggregate a daily rollup slice to the resolution its span calls for.
+    Returns (frame indexed by period start, resolution label: "Date" or "Week").
+    """
+    span = (daily.index.max() - daily.index.min()).days + 1
+    if span <= CHART_DAILY_MAX_DAYS:
+        return daily, "Date"
+    weeks = daily[ROLLUP_COLUMNS].resample("W-MON", label="left", closed="left").sum()
+    # Weeks without any rows stay off the chart, like days without rows
+    return weeks[weeks['ROWS'] > 0], "Week"
+
+
+def amount_line_figure(daily, amount_name, title, color):
+    """Line chart of a daily rollup slice's AMOUNT at a span-based resolution; None without data"""
+    if daily.empty:
+        return None
+    periods, label = downsample_rollup(daily)
+    x_name = label.upper()
+    points = pd.DataFrame({x_name: periods.index.date, amount_name: periods['AMOUNT'].to_numpy()})
+    fig = px.line(points, x=x_name, y=amount_name, markers=True, title=f"{title} by {label}")
+    fig.update_traces(line=dict(color=color, width=2))
+    return fig
+
+
+# Tables each dashboard section is built from, by section
+DASHBOARD_SECTION_TABLES = {
+    "kpis": ("_payment_data", "_ptp_data"),
+    "gauge": ("_payment_data", "_target_data"),
+    "conversion": ("_payment_data", "_ptp_data"),
+    "series": ("_payment_data", "_ptp_data"),
+}
+
+
+def dashboard_versions(client_name, section):
+    """Versions of the tables a dashboard section is built from (see DASHBOARD_SECTION_TABLES)"""
+    return tuple(table_version(f"{client_name}{suffix}") for suffix in DASHBOARD_SECTION_TABLES[section])
+
+
+# Built figure sets kept process-wide; entries for superseded table versions age out
+FIGURE_CACHE_MAX_ENTRIES = 64
+
+
+@st.cache_resource(max_entries=FIGURE_CACHE_MAX_ENTRIES, show_spinner=False)
+def dashboard_figures(client_name, section, range_type, selected_date, versions):
+    """
+    Plotly figures of one dashboard section for a client's range: {'gauge'}, {'conversion'}
+    or {'payment', 'ptp'} for "series" (None without data). Keyed on the range and the
+    section's table versions from dashboard_versions, so rerunning reuses them and only a
+    write to a table the section reads rebuilds them.
+    The figures are shared between sessions: do not modify them.
+    """
+    payment_totals, payment_daily = period_rollup(f"{client_name}_payment_data", range_type, selected_date)
+    total_posted_aed = float(payment_totals['AMOUNT'])
+
+    if section == "gauge":
+        target_value = period_target(client_name, range_type, selected_date)
+        return {'gauge': go.Figure(data=[go.Indicator(
+            mode="gauge+number",
+            value=total_posted_aed,
+            title={'text': f"Collections vs Target (AED {target_value:,.0f})"},
+            domain={'x': [0, 1], 'y': [0, 1]},
+            gauge={
+                'axis': {'range': [0, target_value]},
+                'bar': {'color': "darkblue"},
+                'steps': [
+                    {'range': [0, target_value * 0.5], 'color': "lightgray"},
+                    {'range': [target_value * 0.5, target_value], 'color': "gray"}
+                ],
+                'threshold': {
+                    'line': {'color': "red", 'width': 4},
+                    'thickness': 0.75,
+                    'value': target_value
+                }
+            }
+        )])}
+
+    ptp_totals, ptp_daily = period_rollup(f"{client_name}_ptp_data", range_type, selected_date)
+    if section == "conversion":
+        conversion_data = {
+            'Type': ['PTP PROJECTION', 'TOTAL COLLECTIONS'],
+            'Amount (AED)': [float(ptp_totals['AMOUNT']), total_posted_aed]
+        }
+        return {'conversion': px.bar(conversion_data, x='Type', y='Amount (AED)',
+                                     color='Type',
+                                     color_discrete_sequence=['#3498db', '#2ecc71'])}
+
+    return {
+        'payment': amount_line_figure(payment_daily, "POSTED AED", "Payment Posted AED", '#2ecc71'),
+        'ptp': amount_line_figure(ptp_daily, "PTP AMOUNT", "PTP Amount", '#3498db')
+    }
 
 
 # ────────────────────────────────────────────────────────────────────────────────────
+# The date selector is a fragment: changing the date reruns it and the sections it renders, not
+# the login checks, sidebar and header. Each section reads its figures from dashboard_figures,
+# so it only rebuilds them when its own range or tables change.
 
-def display_dashboard(client_name):
-    """Render professional dashboard for ENBD/EIB"""
-    # Use per-client payment_data and ptp_data from session state
-    payment_data = st.session_state.get(f"{client_name}_payment_data", pd.DataFrame())
-    ptp_data = st.session_state.get(f"{client_name}_ptp_data", pd.DataFrame())
-    
-    # Header
-    st.markdown(f"""
-    <div style='text-align: center; padding: 20px; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); border-radius: 10px; margin-bottom: 20px;'>
-        <h1 style='color: white; margin: 0;'>{client_name} PIPELINE</h1>
-    </div>
-    """, unsafe_allow_html=True)
-    
-    # === DATE SELECTOR ===
+@st.fragment
+def dashboard_range_section(client_name):
+    """Date selector; renders the dashboard sections for the selected range"""
     col_selector, col_spacer = st.columns([2, 4])
     with col_selector:
         date_selection_type = st.radio(
@@ -862,99 +2339,92 @@ def display_dashboard(client_name):
             horizontal=True,
             label_visibility="collapsed"
         )
+
+        # Keyed widgets hold the selection. The shown range type's widgets are seeded from
+        # start_date when they appear; the others are dropped so they reseed next time.
+        start_date = st.session_state.start_date
+        widget_seeds = {
+            "Specific Date": {"disp_date": start_date},
+            "By Month": {"disp_year": start_date.year, "disp_month": start_date.month},
+            "By Year": {"disp_year_only": start_date.year},
+        }
+        for range_type, seeds in widget_seeds.items():
+            for key, value in seeds.items():
+                if range_type != date_selection_type:
+                    st.session_state.pop(key, None)
+                elif key not in st.session_state:
+                    st.session_state[key] = value
         
         if date_selection_type == "Specific Date":
-            selected_date = st.date_input(
+            st.date_input(
                 "📅 Select Specific Date",
-                value=st.session_state.start_date,
-                help="Choose a specific date"
+                help="Choose a specific date",
+                key="disp_date"
             )
+            selected_date = st.session_state.disp_date
         elif date_selection_type == "By Month":
             col_year, col_month = st.columns(2)
             with col_year:
-                year = st.number_input(
+                st.number_input(
                     "Year",
                     min_value=2020,
                     max_value=2030,
-                    value=st.session_state.start_date.year,
                     key="disp_year"
                 )
             with col_month:
-                month = st.selectbox(
+                st.selectbox(
                     "Month",
                     list(range(1, 13)),
                     format_func=lambda x: datetime.date(2020, x, 1).strftime('%B'),
-                    index=st.session_state.start_date.month - 1,
                     key="disp_month"
                 )
             # Set to first day of selected month
-            selected_date = datetime.date(year, month, 1)
+            selected_date = datetime.date(st.session_state.disp_year, st.session_state.disp_month, 1)
         else:  # By Year
-            year = st.number_input(
+            st.number_input(
                 "📅 Select Year",
                 min_value=2020,
                 max_value=2030,
-                value=st.session_state.start_date.year,
                 key="disp_year_only"
             )
             # Set to first day of selected year
-            selected_date = datetime.date(year, 1, 1)
+            selected_date = datetime.date(st.session_state.disp_year_only, 1, 1)
         
-        if selected_date != st.session_state.start_date:
-            st.session_state.start_date = selected_date
-            st.rerun()
+        # Kept for the other tabs; the sections below take the range directly
+        st.session_state.start_date = selected_date
     
     st.markdown("---")
     
-    # === TOP METRICS ===
-    col1, col2, col3, col4 = st.columns(4)
+    dashboard_kpis_section(client_name, date_selection_type, selected_date)
     
-    # Calculate totals from DATE-based columns if they exist
-    total_posted_aed = 0
-    total_ptp_amount = 0
-    total_collections_count = 0
-    total_ptp_count = 0
+    st.markdown("---")
     
-    # Filter payment data by date
-    filtered_payment = payment_data.copy()
-    filtered_ptp = ptp_data.copy()
+    # === COLLECTION VS TARGET SECTION ===
+    col_target1, col_target2 = st.columns(2)
+    with col_target1:
+        dashboard_target_section(client_name, date_selection_type, selected_date)
+    with col_target2:
+        dashboard_conversion_section(client_name, date_selection_type, selected_date)
     
-    if not filtered_payment.empty and "DATE" in filtered_payment.columns:
-        filtered_payment["DATE"] = pd.to_datetime(filtered_payment["DATE"], errors='coerce')
-        selected_dt = pd.Timestamp(st.session_state.start_date)
-        
-        if date_selection_type == "Specific Date":
-            filtered_payment = filtered_payment[filtered_payment["DATE"].dt.date == st.session_state.start_date]
-        elif date_selection_type == "By Month":
-            filtered_payment = filtered_payment[
-                (filtered_payment["DATE"].dt.year == selected_dt.year) &
-                (filtered_payment["DATE"].dt.month == selected_dt.month)
-            ]
-        else:  # By Year
-            filtered_payment = filtered_payment[filtered_payment["DATE"].dt.year == selected_dt.year]
+    st.markdown("---")
     
-    if not filtered_ptp.empty and "DATE" in filtered_ptp.columns:
-        filtered_ptp["DATE"] = pd.to_datetime(filtered_ptp["DATE"], errors='coerce')
-        selected_dt = pd.Timestamp(st.session_state.start_date)
-        
-        if date_selection_type == "Specific Date":
-            filtered_ptp = filtered_ptp[filtered_ptp["DATE"].dt.date == st.session_state.start_date]
-        elif date_selection_type == "By Month":
-            filtered_ptp = filtered_ptp[
-                (filtered_ptp["DATE"].dt.year == selected_dt.year) &
-                (filtered_ptp["DATE"].dt.month == selected_dt.month)
-            ]
-        else:  # By Year
-            filtered_ptp = filtered_ptp[filtered_ptp["DATE"].dt.year == selected_dt.year]
+    dashboard_series_section(client_name, date_selection_type, selected_date)
     
-    # Calculate totals
-    if "POSTED AED" in filtered_payment.columns:
-        total_posted_aed = pd.to_numeric(filtered_payment["POSTED AED"], errors='coerce').sum()
-        total_collections_count = len(filtered_payment[filtered_payment["POSTED AED"].notna()])
+    st.markdown("---")
+
+
+def dashboard_kpis_section(client_name, range_type, selected_date):
+    """Top metrics: collection and PTP totals for the range"""
+    col1, col2, col3, col4 = st.columns(4)
     
-    if "PTP AMOUNT" in filtered_ptp.columns:
-        total_ptp_amount = pd.to_numeric(filtered_ptp["PTP AMOUNT"], errors='coerce').sum()
-        total_ptp_count = len(filtered_ptp[filtered_ptp["PTP AMOUNT"].notna()])
+    # Totals for the selected range come from the daily rollups
+    payment_totals, _ = period_rollup(f"{client_name}_payment_data", range_type, selected_date)
+    ptp_totals, _ = period_rollup(f"{client_name}_ptp_data", range_type, selected_date)
+
+    total_posted_aed = float(payment_totals['AMOUNT'])
+    total_ptp_amount = float(ptp_totals['AMOUNT'])
+    total_collections_count = int(payment_totals['COUNT'])
+    total_ptp_count = int(ptp_totals['COUNT'])
     
     with col1:
         st.metric("💰 TOTAL COLLECTIONS (AED)", f"AED {total_posted_aed:,.4f}", help="Posted AED")
@@ -967,138 +2437,260 @@ def display_dashboard(client_name):
     
     with col4:
         st.metric("📈 PTP PROJECTION", int(total_ptp_count))
-    
-    st.markdown("---")
-    
-    # === COLLECTION VS TARGET SECTION ===
-    col_target1, col_target2 = st.columns(2)
-    
-    with col_target1:
-        st.subheader("📊 COLLECTION VS TARGET")
-        
-        # Get target value from per-client target_data based on selected date
-        target_value = 100000  # Default
-        target_data = st.session_state.get(f"{client_name}_target_data", pd.DataFrame())
-        
-        if not target_data.empty:
-            # Ensure Year and Month are numeric
-            target_data = target_data.copy()
-            target_data['Year'] = pd.to_numeric(target_data['Year'], errors='coerce')
-            target_data['Month'] = pd.to_numeric(target_data['Month'], errors='coerce')
-            target_data['Target AED'] = pd.to_numeric(target_data['Target AED'], errors='coerce')
-            
-            current_year = st.session_state.start_date.year
-            current_month = st.session_state.start_date.month
-            
-            if date_selection_type == "Specific Date" or date_selection_type == "By Month":
-                # Find target for this year and month
-                matching_target = target_data[
-                    (target_data['Year'] == current_year) &
-                    (target_data['Month'] == current_month)
-                ]
-                if not matching_target.empty:
-                    target_value = float(matching_target.iloc[0]['Target AED'])
-            elif date_selection_type == "By Year":
-                # Average targets for the year
-                year_targets = target_data[target_data['Year'] == current_year]
-                if not year_targets.empty:
-                    target_value = float(year_targets['Target AED'].mean())
-        
-        # Create gauge chart comparing total collections vs target
-        fig_gauge = go.Figure(data=[go.Indicator(
-            mode="gauge+number",
-            value=total_posted_aed,
-            title={'text': f"Collections vs Target (AED {target_value:,.0f})"},
-            domain={'x': [0, 1], 'y': [0, 1]},
-            gauge={
-                'axis': {'range': [0, target_value]},
-                'bar': {'color': "darkblue"},
-                'steps': [
-                    {'range': [0, target_value * 0.5], 'color': "lightgray"},
-                    {'range': [target_value * 0.5, target_value], 'color': "gray"}
-                ],
-                'threshold': {
-                    'line': {'color': "red", 'width': 4},
-                    'thickness': 0.75,
-                    'value': target_value
-                }
-            }
-        )])
-        st.plotly_chart(fig_gauge, use_container_width=True)
-        
-        # Show target info
-        col_info1, col_info2, col_info3 = st.columns(3)
-        with col_info1:
-            st.metric("Current Target", f"AED {target_value:,.0f}")
-        with col_info2:
-            st.metric("Total Collections", f"AED {total_posted_aed:,.2f}")
-        with col_info3:
-            if target_value > 0:
-                progress = (total_posted_aed / target_value) * 100
-                st.metric("Progress", f"{progress:.1f}%")
-            else:
-                st.metric("Progress", "N/A")
-    
-    with col_target2:
-        st.subheader("📈 CONVERTED PTP")
-        # Bar chart showing PTP vs Payment conversion
-        conversion_data = {
-            'Type': ['PTP PROJECTION', 'TOTAL COLLECTIONS'],
-            'Amount (AED)': [total_ptp_amount, total_posted_aed]
-        }
-        fig_conversion = px.bar(conversion_data, x='Type', y='Amount (AED)', 
-                               color='Type', 
-                               color_discrete_sequence=['#3498db', '#2ecc71'])
-        st.plotly_chart(fig_conversion, use_container_width=True)
-    
-    st.markdown("---")
-    
-    # === CHARTS SECTION ===
+
+
+def dashboard_target_section(client_name, range_type, selected_date):
+    """Collections vs target gauge with the target and progress figures"""
+    st.subheader("📊 COLLECTION VS TARGET")
+    
+    # Target for the selected range (default 100,000)
+    target_value = period_target(client_name, range_type, selected_date)
+    payment_totals, _ = period_rollup(f"{client_name}_payment_data", range_type, selected_date)
+    total_posted_aed = float(payment_totals['AMOUNT'])
+    
+    # Gauge chart comparing total collections vs target
+    figures = dashboard_figures(client_name, "gauge", range_type, selected_date,
+                                dashboard_versions(client_name, "gauge"))
+    st.plotly_chart(figures['gauge'], use_container_width=True)
+    
+    # Show target info
+    col_info1, col_info2, col_info3 = st.columns(3)
+    with col_info1:
+        st.metric("Current Target", f"AED {target_value:,.0f}")
+    with col_info2:
+        st.metric("Total Collections", f"AED {total_posted_aed:,.2f}")
+    with col_info3:
+        if target_value > 0:
+            progress = (total_posted_aed / target_value) * 100
+            st.metric("Progress", f"{progress:.1f}%")
+        else:
+            st.metric("Progress", "N/A")
+
+
+def dashboard_conversion_section(client_name, range_type, selected_date):
+    """PTP vs payment conversion bar chart"""
+    st.subheader("📈 CONVERTED PTP")
+    figures = dashboard_figures(client_name, "conversion", range_type, selected_date,
+                                dashboard_versions(client_name, "conversion"))
+    st.plotly_chart(figures['conversion'], use_container_width=True)
+
+
+def dashboard_series_section(client_name, range_type, selected_date):
+    """Payment and PTP amount line charts for the range"""
+    figures = dashboard_figures(client_name, "series", range_type, selected_date,
+                                dashboard_versions(client_name, "series"))
     col_payment_chart, col_ptp_chart = st.columns(2)
     
     with col_payment_chart:
         st.subheader("💳 PAYMENT - POSTED AED")
-        # Group by DATE and sum POSTED AED
-        if "DATE" in filtered_payment.columns and "POSTED AED" in filtered_payment.columns and not filtered_payment.empty:
-            data_copy = filtered_payment.copy()
-            data_copy["DATE"] = pd.to_datetime(data_copy["DATE"], errors='coerce')
-            payment_by_date = data_copy.groupby(data_copy["DATE"].dt.date)["POSTED AED"].apply(
-                lambda x: pd.to_numeric(x, errors='coerce').sum()
-            ).reset_index()
-            payment_by_date.columns = ["DATE", "POSTED AED"]
-            
-            fig_payment = px.line(payment_by_date, x='DATE', y='POSTED AED',
-                                 markers=True, title="Payment Posted AED by Date")
-            fig_payment.update_traces(line=dict(color='#2ecc71', width=2))
-            st.plotly_chart(fig_payment, use_container_width=True)
+        # POSTED AED sums from the daily rollup
+        if figures['payment'] is not None:
+            st.plotly_chart(figures['payment'], use_container_width=True)
         else:
             st.info("📊 No payment data available")
     
     with col_ptp_chart:
         st.subheader("📋 PTP PROJECTION - PTP AMOUNT")
-        # Group by DATE and sum PTP AMOUNT
-        if "DATE" in filtered_ptp.columns and "PTP AMOUNT" in filtered_ptp.columns and not filtered_ptp.empty:
-            data_copy = filtered_ptp.copy()
-            data_copy["DATE"] = pd.to_datetime(data_copy["DATE"], errors='coerce')
-            ptp_by_date = data_copy.groupby(data_copy["DATE"].dt.date)["PTP AMOUNT"].apply(
-                lambda x: pd.to_numeric(x, errors='coerce').sum()
-            ).reset_index()
-            ptp_by_date.columns = ["DATE", "PTP AMOUNT"]
-            
-            fig_ptp = px.line(ptp_by_date, x='DATE', y='PTP AMOUNT',
-                             markers=True, title="PTP Amount by Date")
-            fig_ptp.update_traces(line=dict(color='#3498db', width=2))
-            st.plotly_chart(fig_ptp, use_container_width=True)
+        # PTP AMOUNT sums from the daily rollup
+        if figures['ptp'] is not None:
+            st.plotly_chart(figures['ptp'], use_container_width=True)
         else:
             st.info("📊 No PTP data available")
+
+
+# ────────────────────────────────────────────────────────────────────────────────────
+
+def display_dashboard(client_name):
+    """Render professional dashboard for ENBD/EIB"""
+    # Load per-client payment_data and ptp_data into the shared data layer; the dashboard reads
+    # their rollups only, so buffered appends are left for the next full-frame reader
+    load_table(f"{client_name}_payment_data", PAYMENT_COLUMNS)
+    load_table(f"{client_name}_ptp_data", PTP_COLUMNS)
     
-    st.markdown("---")
+    # Header
+    st.markdown(f"""
+    <div style='text-align: center; padding: 20px; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); border-radius: 10px; margin-bottom: 20px;'>
+        <h1 style='color: white; margin: 0;'>{client_name} PIPELINE</h1>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    dashboard_range_section(client_name)
 
 
 # ┌─────────────────────────────────────────────────────────────────────────────────┐
 # │              DATA MANAGEMENT TAB FUNCTIONS                    │
 # └─────────────────────────────────────────────────────────────────────────────────┘
 
+def bulk_import_expander(session_key, schema, form_key):
+    """Bulk CSV/Excel import for a payment/PTP sheet with column mapping and an import summary"""
+    with st.expander("📤 Bulk Import (CSV/Excel)"):
+        summary = st.session_state.get(f"{form_key}_summary")
+        if summary:
+            st.success(
+                f"✓ Inserted {summary['inserted']}, updated {summary['updated']}, "
+                f"rejected {summary['rejected']} row(s)"
+                + (f" ({summary['duplicates']} duplicate key(s) in file merged)" if summary['duplicates'] else "")
+            )
+            if summary['rejected']:
+                st.dataframe(summary['rejected_rows'], use_container_width=True, height=200)
+
+        uploaded_file = st.file_uploader(
+            "Upload payment/PTP rows",
+            type=["csv", "xlsx", "xls"],
+            key=f"{form_key}_file"
+        )
+        if uploaded_file is None:
+            return
+
+        try:
+            raw = read_import_file(uploaded_file)
+        except Exception as e:
+            st.error(f"Error reading file: {str(e)}")
+            return
+
+        st.caption(f"{len(raw):,} rows, {len(raw.columns)} columns. Map file columns to sheet columns:")
+        guessed = guess_import_mapping(raw.columns, schema)
+        options = ["(not in file)"] + list(raw.columns)
+        mapping = {}
+        cols_input = st.columns(3)
+        for i, col in enumerate(schema):
+            choice = cols_input[i % 3].selectbox(
+                col,
+                options,
+                index=options.index(guessed[col]) if col in guessed else 0,
+                key=(f"{form_key}_map_{col}").replace(' ', '_')
+            )
+            if choice != options[0]:
+                mapping[col] = choice
+
+        if st.button("📥 Import Rows", key=f"{form_key}_btn"):
+            try:
+                st.session_state[f"{form_key}_summary"] = import_sheet_rows(session_key, raw, mapping, schema)
+                st.rerun()
+            except ValueError as e:
+                st.error(str(e))
+
+
+# ────────────────────────────────────────────────────────────────────────────────────
+
+def sheet_key_mask(frame, agreement_from="", agreement_to="", date_from=None, date_to=None):
+    """
+    Boolean mask of sheet rows whose AGREEMENT NO (text order) and DATE fall inside the
+    given inclusive bounds; empty bounds are open.
+    """
+    mask = pd.Series(True, index=frame.index)
+    if 'AGREEMENT NO' in frame.columns and (agreement_from or agreement_to):
+        agreements = frame['AGREEMENT NO'].astype(str).str.strip()
+        mask &= frame['AGREEMENT NO'].notna()
+        if agreement_from:
+            mask &= agreements >= agreement_from.strip()
+        if agreement_to:
+            mask &= agreements <= agreement_to.strip()
+    if 'DATE' in frame.columns:
+        if date_from is not None:
+            mask &= frame['DATE'] >= pd.Timestamp(date_from)
+        if date_to is not None:
+            mask &= frame['DATE'] < pd.Timestamp(date_to) + pd.Timedelta(days=1)
+    return mask
+
+
+def page_of(frame, page, page_size):
+    """Rows of the 1-based `page` of a frame"""
+    start = (page - 1) * page_size
+    return frame.iloc[start:start + page_size]
+
+
+GRID_PAGE_SIZES = [50, 100, 250, 500]
+
+
+def paginated_grid(frame, grid_key, editable=False):
+    """
+    Render one page of a table. Filter, sort and the visible-column choice run in pandas and
+    only the current page is sent to the browser. Returns the page as shown (or as edited).
+    """
+    columns = list(frame.columns)
+    with st.expander("⚙️ Columns, sort and filter"):
+        visible = st.multiselect("Visible columns", columns, default=columns, key=f"{grid_key}_columns") or columns
+        col_sort, col_order, col_filter, col_text = st.columns([2, 1, 2, 2])
+        sort_by = col_sort.selectbox("Sort by", ["(table order)"] + columns, key=f"{grid_key}_sort")
+        descending = col_order.checkbox("Descending", key=f"{grid_key}_descending")
+        filter_col = col_filter.selectbox("Filter column", ["(none)"] + columns, key=f"{grid_key}_filter_col")
+        filter_text = col_text.text_input("Contains", key=f"{grid_key}_filter_text")
+
+    view = frame
+    if filter_col != "(none)" and filter_text:
+        view = view[view[filter_col].astype(str).str.contains(filter_text, case=False, regex=False, na=False)]
+    if sort_by != "(table order)":
+        view = view.sort_values(sort_by, ascending=not descending, kind='stable', na_position='last')
+
+    col_size, col_page, col_info = st.columns([1, 1, 2])
+    page_size = col_size.selectbox("Rows per page", GRID_PAGE_SIZES, key=f"{grid_key}_page_size")
+    pages = max(1, -(-len(view) // page_size))
+    page = col_page.number_input("Page", min_value=1, max_value=pages, value=1, key=f"{grid_key}_page")
+    col_info.caption(f"{len(view):,} row(s), page {page} of {pages}")
+
+    page_rows = page_of(view, page, page_size)[visible]
+    if not editable:
+        st.dataframe(page_rows, use_container_width=True)
+        return page_rows
+    # Key the editor on the rows it shows so edits never carry over to a different page or order
+    rows_id = hashlib.sha1(repr((tuple(page_rows.index), tuple(visible))).encode()).hexdigest()[:12]
+    return st.data_editor(page_rows, key=f"{grid_key}_editor_{rows_id}", use_container_width=True)
+
+
+def delete_rows_panel(session_key, form_key):
+    """
+    Deletion controls for a payment/PTP sheet: filter by AGREEMENT NO / DATE range, pick rows
+    from the current page only, and delete by row_id.
+    """
+    table = get_table(session_key)
+    if table.empty:
+        return
+
+    with st.expander("🗑️ Delete Rows"):
+        col_from, col_to, col_date_from, col_date_to = st.columns(4)
+        agreement_from = col_from.text_input("AGREEMENT NO from", key=f"{form_key}_agreement_from")
+        agreement_to = col_to.text_input("AGREEMENT NO to", key=f"{form_key}_agreement_to")
+        date_from = col_date_from.date_input("DATE from", value=None, key=f"{form_key}_date_from")
+        date_to = col_date_to.date_input("DATE to", value=None, key=f"{form_key}_date_to")
+        filtered = bool(agreement_from or agreement_to or date_from or date_to)
+        matches = table[sheet_key_mask(table, agreement_from, agreement_to, date_from, date_to)]
+
+        col_size, col_page, col_info = st.columns([1, 1, 2])
+        page_size = col_size.selectbox("Rows per page", [25, 50, 100], key=f"{form_key}_page_size")
+        pages = max(1, -(-len(matches) // page_size))
+        page = col_page.number_input("Page", min_value=1, max_value=pages, value=1, key=f"{form_key}_page")
+        col_info.caption(f"{len(matches):,} matching row(s), page {page} of {pages}")
+
+        page_rows = page_of(matches, page, page_size)
+        picked = st.data_editor(
+            page_rows.assign(SELECT=False)[['SELECT'] + list(page_rows.columns)],
+            disabled=list(page_rows.columns),
+            key=f"{form_key}_rows_{page}_{page_size}",
+            use_container_width=True
+        )
+        selected = picked.index[picked['SELECT'].astype(bool)]
+
+        col_selected, col_matching = st.columns(2)
+        with col_selected:
+            if st.button(f"🗑️ Delete Selected ({len(selected)})", key=f"{form_key}_btn", disabled=selected.empty):
+                delete_rows(session_key, selected)
+                st.success(f"✓ Deleted {len(selected)} row(s)")
+                st.rerun()
+        with col_matching:
+            if st.button(
+                f"🗑️ Delete All {len(matches):,} Matching",
+                key=f"{form_key}_matching_btn",
+                disabled=not filtered or matches.empty,
+                help="Set an AGREEMENT NO or DATE range first"
+            ):
+                delete_rows(session_key, matches.index)
+                st.success(f"✓ Deleted {len(matches)} row(s)")
+                st.rerun()
+
+
+# ────────────────────────────────────────────────────────────────────────────────────
+
 def payment_monitoring_tab_enbd(client_name="ENBD"):
     """Payment monitoring sheet (read-only grid; add/delete only)"""
     st.subheader(f"💳 {client_name} - Payment Monitoring Sheet")
@@ -1107,26 +2699,8 @@ def payment_monitoring_tab_enbd(client_name="ENBD"):
     # Use client-specific session state keys
     session_key = f"{client_name}_payment_data"
 
-    # Initialize payment data in session state if not exists
-    if session_key not in st.session_state:
-        st.session_state[session_key] = pd.DataFrame({
-            'AGREEMENT NO': [],
-            'AGREEMENT ID': [],
-            'CIF NO': [],
-            'RELATIONSHIP NO': [],
-            'TOUCHED POINTS': [],
-            'OFFICIAL AGENT': [],
-            'CM NAME': [],
-            'PRODUCTS CAT': [],
-            'VINTAGE': [],
-            'PAYMENT STATUS': [],
-            'DATE': [],
-            'POSTED AED': [],
-            'POSTED PH': [],
-            'CF %': [],
-            'CF AMT': [],
-            'MONTH': []
-        })
+    # Load payment data from the store on first access
+    load_table(session_key, PAYMENT_COLUMNS)
 
     col1, col2 = st.columns([3, 1])
 
@@ -1139,53 +2713,34 @@ def payment_monitoring_tab_enbd(client_name="ENBD"):
             new_vals = {}
             form_key_base = f"add_payment_{client_name}"
             cols_input = st.columns(3)
-            for i, col in enumerate(st.session_state[session_key].columns):
+            for i, col in enumerate(load_table(session_key).columns):
                 c = cols_input[i % 3]
                 key = (f"{form_key_base}_{col}").replace(' ', '_')
                 new_vals[col] = c.text_input(col, key=key)
             submitted = st.form_submit_button("Add Record")
             if submitted:
-                new_row = {col: new_vals.get(col, '') for col in st.session_state[session_key].columns}
+                new_row = {col: new_vals.get(col, '') for col in load_table(session_key).columns}
                 # default MONTH if present
                 if 'MONTH' in new_row and not new_row['MONTH']:
                     new_row['MONTH'] = st.session_state.start_date.strftime('%Y-%m')
-                st.session_state[session_key] = pd.concat(
-                    [st.session_state[session_key], pd.DataFrame([new_row])],
-                    ignore_index=True
-                )
+                append_rows(session_key, pd.DataFrame([new_row]))
                 st.success("✓ Record added")
                 st.rerun()
 
-    # Display read-only grid
-    st.dataframe(st.session_state[session_key], use_container_width=True, height=500)
-
-    # Deletion controls
-    if not st.session_state[session_key].empty:
-        # Build human-friendly labels for rows
-        def _row_label(i, row):
-            label_field = None
-            for cand in ['AGREEMENT NO', 'AGREEMENT ID', 'AGREEMENT', 'CIF NO']:
-                if cand in st.session_state[session_key].columns:
-                    label_field = cand
-                    break
-            label_val = str(row[label_field]) if label_field else str(i)
-            return f"{i} - {label_val}"
-
-        options = [_row_label(i, st.session_state[session_key].iloc[i]) for i in range(len(st.session_state[session_key]))]
-        to_delete = st.multiselect("Select rows to delete", options, key=f"delete_payment_rows_{client_name}")
-        if st.button("🗑️ Delete Selected", key=f"delete_payment_btn_{client_name}"):
-            if to_delete:
-                # parse indices and drop
-                indices = [int(x.split(' - ')[0]) for x in to_delete]
-                st.session_state[session_key] = st.session_state[session_key].drop(index=indices).reset_index(drop=True)
-                st.success(f"✓ Deleted {len(indices)} row(s)")
-                st.rerun()
+    # Bulk import from a file
+    bulk_import_expander(session_key, PAYMENT_SCHEMA, f"import_payment_{client_name}")
+
+    # Display read-only grid (one page at a time)
+    paginated_grid(get_table(session_key), f"grid_payment_{client_name}")
+
+    # Deletion controls (paged selection and key-range delete)
+    delete_rows_panel(session_key, f"delete_payment_{client_name}")
     
     col1, col2, col3 = st.columns(3)
     
     with col1:
         if st.button("📥 Download Payment Data", key=f"download_payment_{client_name}"):
-            csv = st.session_state[session_key].to_csv(index=False)
+            csv = get_table(session_key).to_csv(index=False)
             st.download_button(
                 label="CSV File",
                 data=csv,
@@ -1193,15 +2748,13 @@ def payment_monitoring_tab_enbd(client_name="ENBD"):
                 mime="text/csv"
             )
     
+    # Count and total without compacting buffered appends into the frame
+    record_count, total_posted_aed = table_stats(session_key, 'POSTED AED')
     with col2:
-        st.metric("Total Records", len(st.session_state[session_key]))
+        st.metric("Total Records", record_count)
     
     with col3:
-        try:
-            total_posted_aed = pd.to_numeric(st.session_state[session_key]['POSTED AED'], errors='coerce').sum()
-            st.metric("Total Posted AED", f"AED {total_posted_aed:,.2f}")
-        except:
-            st.metric("Total Posted AED", "AED 0.00")
+        st.metric("Total Posted AED", f"AED {total_posted_aed:,.2f}")
 
 def payment_monitoring_tab_eib(client_name="EIB"):
     """Payment monitoring sheet (read-only grid; add/delete only)"""
@@ -1211,26 +2764,8 @@ def payment_monitoring_tab_eib(client_name="EIB"):
     # Use client-specific session state keys
     session_key = f"{client_name}_payment_data"
 
-    # Initialize payment data in session state if not exists
-    if session_key not in st.session_state:
-        st.session_state[session_key] = pd.DataFrame({
-            'AGREEMENT NO': [],
-            'AGREEMENT ID': [],
-            'CIF NO': [],
-            'RELATIONSHIP NO': [],
-            'TOUCHED POINTS': [],
-            'OFFICIAL AGENT': [],
-            'CM NAME': [],
-            'PRODUCTS CAT': [],
-            'VINTAGE': [],
-            'PAYMENT STATUS': [],
-            'DATE': [],
-            'POSTED AED': [],
-            'POSTED PH': [],
-            'CF %': [],
-            'CF AMT': [],
-            'MONTH': []
-        })
+    # Load payment data from the store on first access
+    load_table(session_key, PAYMENT_COLUMNS)
 
     col1, col2 = st.columns([3, 1])
 
@@ -1243,53 +2778,34 @@ def payment_monitoring_tab_eib(client_name="EIB"):
             new_vals = {}
             form_key_base = f"add_payment_{client_name}"
             cols_input = st.columns(3)
-            for i, col in enumerate(st.session_state[session_key].columns):
+            for i, col in enumerate(load_table(session_key).columns):
                 c = cols_input[i % 3]
                 key = (f"{form_key_base}_{col}").replace(' ', '_')
                 new_vals[col] = c.text_input(col, key=key)
             submitted = st.form_submit_button("Add Record")
             if submitted:
-                new_row = {col: new_vals.get(col, '') for col in st.session_state[session_key].columns}
+                new_row = {col: new_vals.get(col, '') for col in load_table(session_key).columns}
                 # default MONTH if present
                 if 'MONTH' in new_row and not new_row['MONTH']:
                     new_row['MONTH'] = st.session_state.start_date.strftime('%Y-%m')
-                st.session_state[session_key] = pd.concat(
-                    [st.session_state[session_key], pd.DataFrame([new_row])],
-                    ignore_index=True
-                )
+                append_rows(session_key, pd.DataFrame([new_row]))
                 st.success("✓ Record added")
                 st.rerun()
 
-    # Display read-only grid
-    st.dataframe(st.session_state[session_key], use_container_width=True, height=500)
-
-    # Deletion controls
-    if not st.session_state[session_key].empty:
-        # Build human-friendly labels for rows
-        def _row_label(i, row):
-            label_field = None
-            for cand in ['AGREEMENT NO', 'AGREEMENT ID', 'AGREEMENT', 'CIF NO']:
-                if cand in st.session_state[session_key].columns:
-                    label_field = cand
-                    break
-            label_val = str(row[label_field]) if label_field else str(i)
-            return f"{i} - {label_val}"
-
-        options = [_row_label(i, st.session_state[session_key].iloc[i]) for i in range(len(st.session_state[session_key]))]
-        to_delete = st.multiselect("Select rows to delete", options, key=f"delete_payment_rows_{client_name}")
-        if st.button("🗑️ Delete Selected", key=f"delete_payment_btn_{client_name}"):
-            if to_delete:
-                # parse indices and drop
-                indices = [int(x.split(' - ')[0]) for x in to_delete]
-                st.session_state[session_key] = st.session_state[session_key].drop(index=indices).reset_index(drop=True)
-                st.success(f"✓ Deleted {len(indices)} row(s)")
-                st.rerun()
+    # Bulk import from a file
+    bulk_import_expander(session_key, PAYMENT_SCHEMA, f"import_payment_{client_name}")
+
+    # Display read-only grid (one page at a time)
+    paginated_grid(get_table(session_key), f"grid_payment_{client_name}")
+
+    # Deletion controls (paged selection and key-range delete)
+    delete_rows_panel(session_key, f"delete_payment_{client_name}")
     
     col1, col2, col3 = st.columns(3)
     
     with col1:
         if st.button("📥 Download Payment Data", key=f"download_payment_{client_name}"):
-            csv = st.session_state[session_key].to_csv(index=False)
+            csv = get_table(session_key).to_csv(index=False)
             st.download_button(
                 label="CSV File",
                 data=csv,
@@ -1297,15 +2813,13 @@ def payment_monitoring_tab_eib(client_name="EIB"):
                 mime="text/csv"
             )
     
+    # Count and total without compacting buffered appends into the frame
+    record_count, total_posted_aed = table_stats(session_key, 'POSTED AED')
     with col2:
-        st.metric("Total Records", len(st.session_state[session_key]))
+        st.metric("Total Records", record_count)
     
     with col3:
-        try:
-            total_posted_aed = pd.to_numeric(st.session_state[session_key]['POSTED AED'], errors='coerce').sum()
-            st.metric("Total Posted AED", f"AED {total_posted_aed:,.2f}")
-        except:
-            st.metric("Total Posted AED", "AED 0.00")
+        st.metric("Total Posted AED", f"AED {total_posted_aed:,.2f}")
 
 # ────────────────────────────────────────────────────────────────────────────────────
 
@@ -1317,24 +2831,8 @@ def ptp_list_tab_enbd(client_name="ENBD"):
     # Use client-specific session state keys
     session_key = f"{client_name}_ptp_data"
     
-    # Initialize PTP data in session state if not exists
-    if session_key not in st.session_state:
-        st.session_state[session_key] = pd.DataFrame({
-            'AGREEMENT NO': [],
-            'AGREEMENT ID': [],
-            'CUSTOMER NO': [],
-            'RELATIONSHIP NO': [],
-            'AGENT': [],
-            'CM NAME': [],
-            'PRODUCTS CAT': [],
-            'VINTAGE': [],
-            'STATUS': [],
-            'DATE': [],
-            'MONTH': [],
-            'PTP AMOUNT': [],
-            'STATUS TODAY': [],
-            'BROKEN AMOUNT': []
-        })
+    # Load PTP data from the store on first access
+    load_table(session_key, PTP_COLUMNS)
     
     col1, col2 = st.columns([3, 1])
 
@@ -1347,50 +2845,33 @@ def ptp_list_tab_enbd(client_name="ENBD"):
             new_vals = {}
             form_key_base = f"add_ptp_{client_name}"
             cols_input = st.columns(3)
-            for i, col in enumerate(st.session_state[session_key].columns):
+            for i, col in enumerate(load_table(session_key).columns):
                 c = cols_input[i % 3]
                 key = (f"{form_key_base}_{col}").replace(' ', '_')
                 new_vals[col] = c.text_input(col, key=key)
             submitted = st.form_submit_button("Add Record")
             if submitted:
-                new_row = {col: new_vals.get(col, '') for col in st.session_state[session_key].columns}
+                new_row = {col: new_vals.get(col, '') for col in load_table(session_key).columns}
                 if 'MONTH' in new_row and not new_row['MONTH']:
                     new_row['MONTH'] = st.session_state.start_date.strftime('%Y-%m')
-                st.session_state[session_key] = pd.concat(
-                    [st.session_state[session_key], pd.DataFrame([new_row])],
-                    ignore_index=True
-                )
+                append_rows(session_key, pd.DataFrame([new_row]))
                 st.success("✓ Record added")
                 st.rerun()
 
-    # Display read-only grid
-    st.dataframe(st.session_state[session_key], use_container_width=True, height=500)
-
-    # Deletion controls
-    if not st.session_state[session_key].empty:
-        def _row_label(i, row):
-            label_field = None
-            for cand in ['AGREEMENT NO', 'AGREEMENT ID', 'CUSTOMER NO', 'AGREEMENT']:
-                if cand in st.session_state[session_key].columns:
-                    label_field = cand
-                    break
-            label_val = str(row[label_field]) if label_field else str(i)
-            return f"{i} - {label_val}"
-
-        options = [_row_label(i, st.session_state[session_key].iloc[i]) for i in range(len(st.session_state[session_key]))]
-        to_delete = st.multiselect("Select rows to delete", options, key=f"delete_ptp_rows_{client_name}")
-        if st.button("🗑️ Delete Selected", key=f"delete_ptp_btn_{client_name}"):
-            if to_delete:
-                indices = [int(x.split(' - ')[0]) for x in to_delete]
-                st.session_state[session_key] = st.session_state[session_key].drop(index=indices).reset_index(drop=True)
-                st.success(f"✓ Deleted {len(indices)} row(s)")
-                st.rerun()
+    # Bulk import from a file
+    bulk_import_expander(session_key, PTP_SCHEMA, f"import_ptp_{client_name}")
+
+    # Display read-only grid (one page at a time)
+    paginated_grid(get_table(session_key), f"grid_ptp_{client_name}")
+
+    # Deletion controls (paged selection and key-range delete)
+    delete_rows_panel(session_key, f"delete_ptp_{client_name}")
     
     col1, col2, col3 = st.columns(3)
     
     with col1:
         if st.button("📥 Download PTP Data", key=f"download_ptp_{client_name}"):
-            csv = st.session_state[session_key].to_csv(index=False)
+            csv = get_table(session_key).to_csv(index=False)
             st.download_button(
                 label="CSV File",
                 data=csv,
@@ -1398,15 +2879,13 @@ def ptp_list_tab_enbd(client_name="ENBD"):
                 mime="text/csv"
             )
     
+    # Count and total without compacting buffered appends into the frame
+    record_count, ptp_amount = table_stats(session_key, 'PTP AMOUNT')
     with col2:
-        st.metric("Total PTP Records", len(st.session_state[session_key]))
+        st.metric("Total PTP Records", record_count)
     
     with col3:
-        try:
-            ptp_amount = pd.to_numeric(st.session_state[session_key]['PTP AMOUNT'], errors='coerce').sum()
-            st.metric("Total PTP Amount", f"AED {ptp_amount:,.2f}")
-        except:
-            st.metric("Total PTP Amount", "AED 0.00")
+        st.metric("Total PTP Amount", f"AED {ptp_amount:,.2f}")
 
 def ptp_list_tab_eib(client_name="EIB"):
     """Editable PTP list sheet"""
@@ -1416,24 +2895,8 @@ def ptp_list_tab_eib(client_name="EIB"):
     # Use client-specific session state keys
     session_key = f"{client_name}_ptp_data"
     
-    # Initialize PTP data in session state if not exists
-    if session_key not in st.session_state:
-        st.session_state[session_key] = pd.DataFrame({
-            'AGREEMENT NO': [],
-            'AGREEMENT ID': [],
-            'CUSTOMER NO': [],
-            'RELATIONSHIP NO': [],
-            'AGENT': [],
-            'CM NAME': [],
-            'PRODUCTS CAT': [],
-            'VINTAGE': [],
-            'STATUS': [],
-            'DATE': [],
-            'MONTH': [],
-            'PTP AMOUNT': [],
-            'STATUS TODAY': [],
-            'BROKEN AMOUNT': []
-        })
+    # Load PTP data from the store on first access
+    load_table(session_key, PTP_COLUMNS)
     
     col1, col2 = st.columns([3, 1])
 
@@ -1446,50 +2909,33 @@ def ptp_list_tab_eib(client_name="EIB"):
             new_vals = {}
             form_key_base = f"add_ptp_{client_name}"
             cols_input = st.columns(3)
-            for i, col in enumerate(st.session_state[session_key].columns):
+            for i, col in enumerate(load_table(session_key).columns):
                 c = cols_input[i % 3]
                 key = (f"{form_key_base}_{col}").replace(' ', '_')
                 new_vals[col] = c.text_input(col, key=key)
             submitted = st.form_submit_button("Add Record")
             if submitted:
-                new_row = {col: new_vals.get(col, '') for col in st.session_state[session_key].columns}
+                new_row = {col: new_vals.get(col, '') for col in load_table(session_key).columns}
                 if 'MONTH' in new_row and not new_row['MONTH']:
                     new_row['MONTH'] = st.session_state.start_date.strftime('%Y-%m')
-                st.session_state[session_key] = pd.concat(
-                    [st.session_state[session_key], pd.DataFrame([new_row])],
-                    ignore_index=True
-                )
+                append_rows(session_key, pd.DataFrame([new_row]))
                 st.success("✓ Record added")
                 st.rerun()
 
-    # Display read-only grid
-    st.dataframe(st.session_state[session_key], use_container_width=True, height=500)
-
-    # Deletion controls
-    if not st.session_state[session_key].empty:
-        def _row_label(i, row):
-            label_field = None
-            for cand in ['AGREEMENT NO', 'AGREEMENT ID', 'CUSTOMER NO', 'AGREEMENT']:
-                if cand in st.session_state[session_key].columns:
-                    label_field = cand
-                    break
-            label_val = str(row[label_field]) if label_field else str(i)
-            return f"{i} - {label_val}"
-
-        options = [_row_label(i, st.session_state[session_key].iloc[i]) for i in range(len(st.session_state[session_key]))]
-        to_delete = st.multiselect("Select rows to delete", options, key=f"delete_ptp_rows_{client_name}")
-        if st.button("🗑️ Delete Selected", key=f"delete_ptp_btn_{client_name}"):
-            if to_delete:
-                indices = [int(x.split(' - ')[0]) for x in to_delete]
-                st.session_state[session_key] = st.session_state[session_key].drop(index=indices).reset_index(drop=True)
-                st.success(f"✓ Deleted {len(indices)} row(s)")
-                st.rerun()
+    # Bulk import from a file
+    bulk_import_expander(session_key, PTP_SCHEMA, f"import_ptp_{client_name}")
+
+    # Display read-only grid (one page at a time)
+    paginated_grid(get_table(session_key), f"grid_ptp_{client_name}")
+
+    # Deletion controls (paged selection and key-range delete)
+    delete_rows_panel(session_key, f"delete_ptp_{client_name}")
     
     col1, col2, col3 = st.columns(3)
     
     with col1:
         if st.button("📥 Download PTP Data", key=f"download_ptp_{client_name}"):
-            csv = st.session_state[session_key].to_csv(index=False)
+            csv = get_table(session_key).to_csv(index=False)
             st.download_button(
                 label="CSV File",
                 data=csv,
@@ -1497,15 +2943,13 @@ def ptp_list_tab_eib(client_name="EIB"):
                 mime="text/csv"
             )
     
+    # Count and total without compacting buffered appends into the frame
+    record_count, ptp_amount = table_stats(session_key, 'PTP AMOUNT')
     with col2:
-        st.metric("Total PTP Records", len(st.session_state[session_key]))
+        st.metric("Total PTP Records", record_count)
     
     with col3:
-        try:
-            ptp_amount = pd.to_numeric(st.session_state[session_key]['PTP AMOUNT'], errors='coerce').sum()
-            st.metric("Total PTP Amount", f"AED {ptp_amount:,.2f}")
-        except:
-            st.metric("Total PTP Amount", "AED 0.00")
+        st.metric("Total PTP Amount", f"AED {ptp_amount:,.2f}")
 # ────────────────────────────────────────────────────────────────────────────────────
 
 def target_settings_tab(client_name="ENBD"):
@@ -1523,13 +2967,8 @@ def target_settings_tab(client_name="ENBD"):
     # Use per-client session key for targets
     session_key = f"{client_select}_target_data"
 
-    # Initialize target data in session state if not exists for this client
-    if session_key not in st.session_state:
-        st.session_state[session_key] = pd.DataFrame({
-            'Year': [],
-            'Month': [],
-            'Target AED': []
-        })
+    # Load target data for this client from the store on first access
+    get_table(session_key, TARGET_COLUMNS)
     
     col1, col2, col3 = st.columns(3)
     
@@ -1566,16 +3005,17 @@ def target_settings_tab(client_name="ENBD"):
         target_month = int(target_month)
         target_amount = float(target_amount)
         
-        # Check if target for this year/month already exists
+        # Check if target for this year/month already exists (Year/Month are nullable Int64)
+        targets = get_table(session_key)
         existing_mask = (
-            (st.session_state[session_key]['Year'].astype(int) == target_year) &
-            (st.session_state[session_key]['Month'].astype(int) == target_month)
-        )
-        existing = st.session_state[session_key][existing_mask]
+            targets['Year'].eq(target_year).fillna(False) &
+            targets['Month'].eq(target_month).fillna(False)
+        ).astype(bool)
+        existing = targets[existing_mask]
         
         if not existing.empty:
             # Update existing
-            st.session_state[session_key].loc[existing_mask, 'Target AED'] = target_amount
+            update_rows(session_key, existing[['Target AED']].assign(**{'Target AED': target_amount}))
             st.success(f"✓ Updated target for {datetime.date(2020, target_month, 1).strftime('%B')} {target_year}")
         else:
             # Add new
@@ -1584,19 +3024,16 @@ def target_settings_tab(client_name="ENBD"):
                 'Month': [target_month],
                 'Target AED': [target_amount]
             })
-            st.session_state[session_key] = pd.concat(
-                [st.session_state[session_key], new_target],
-                ignore_index=True
-            )
+            append_rows(session_key, new_target)
             st.success(f"✓ Added target for {datetime.date(2020, target_month, 1).strftime('%B')} {target_year}")
         st.rerun()
     
     st.markdown("---")
     st.subheader("📋 Current Targets")
 
-    if not st.session_state[session_key].empty:
+    if not get_table(session_key).empty:
         # Display as editable table
-        display_targets = st.session_state[session_key].copy()
+        display_targets = get_table(session_key).copy()
         
         # Convert month number to name safely
         def month_to_name(x):
@@ -1619,7 +3056,7 @@ def target_settings_tab(client_name="ENBD"):
         
         # Update session state if changes were made
         if not edited_targets.empty:
-            st.session_state[session_key] = display_targets[['Year', 'Month', 'Target AED']].copy()
+            set_table(session_key, display_targets[['Year', 'Month', 'Target AED']].copy())
         
         # Delete targets
         st.markdown("---")
@@ -1628,13 +3065,46 @@ def target_settings_tab(client_name="ENBD"):
             st.markdown("**Delete Target:**")
         with delete_col2:
             if st.button("🗑️ Delete Selected", use_container_width=True):
-                st.session_state[session_key] = st.session_state[session_key].iloc[0:0]  # Clear all for this client
+                delete_rows(session_key, get_table(session_key).index)  # Clear all for this client
                 st.success("✓ All targets cleared")
                 st.rerun()
     else:
         st.info("ℹ️ No targets set yet. Add a target above to get started.")
 
 
+# ────────────────────────────────────────────────────────────────────────────────────
+
+def column_mapping_tab():
+    """Admin overrides for the MASTERLIST column each metric reads"""
+    st.subheader("🧭 MASTERLIST Column Mapping")
+    st.info("📌 Enter the header to use for a role, or leave it blank to auto-detect it from each upload")
+
+    current = dict(column_overrides())
+    with st.form("column_mapping_form"):
+        entered = {
+            role: st.text_input(label, value=current.get(role, ""), key=f"column_override_{role}")
+            for role, label in COLUMN_ROLES.items()
+        }
+        if st.form_submit_button("💾 Save Mapping", use_container_width=True):
+            for role, column in entered.items():
+                if column.strip() != current.get(role, ""):
+                    set_column_override(role, column.strip())
+            st.success("✓ Column mapping saved")
+
+    # Preview which columns a header row resolves to with the saved mapping
+    header_text = st.text_input("Preview a header row (comma-separated)", key="column_mapping_preview")
+    if header_text.strip():
+        cols = resolve_columns([c.strip() for c in header_text.split(",") if c.strip()])
+        st.dataframe(
+            pd.DataFrame({
+                "Role": list(COLUMN_ROLES.values()),
+                "Column": [cols[role] or "—" for role in COLUMN_ROLES]
+            }),
+            use_container_width=True,
+            hide_index=True
+        )
+
+
 # ────────────────────────────────────────────────────────────────────────────────────
 
 def admin_data_tab():
@@ -1642,7 +3112,9 @@ def admin_data_tab():
     st.header("⚙️ Admin - Data Management")
     
     # Main tabs for different data types
-    data_tabs = st.tabs(["Dashboard Data", "ENBD Payment", "EIB Payment", "ENBD PTP", "EIB PTP", "Target Settings"])
+    data_tabs = st.tabs([
+        "Dashboard Data", "ENBD Payment", "EIB Payment", "ENBD PTP", "EIB PTP", "Target Settings", "Column Mapping"
+    ])
     
     with data_tabs[0]:
         dashboard_data_tab()
@@ -1662,6 +3134,9 @@ def admin_data_tab():
     with data_tabs[5]:
         target_settings_tab("")
 
+    with data_tabs[6]:
+        column_mapping_tab()
+
 
 # ────────────────────────────────────────────────────────────────────────────────────
 
@@ -1718,18 +3193,20 @@ def dashboard_data_tab():
             ["ENBD", "EIB"]
         )
 
+    grid_key = "enbd_data" if client_select == "ENBD" else "eib_data"
+
+    # Rows backfilled by the --batch CLI land in the store from another process
+    if st.button("🔄 Reload from store", help="Pick up rows written by the batch CLI", key="reload_grid_btn"):
+        reload_table(grid_key)
+
     # If no data exists yet for the selected client, populate defaults
-    if client_select == "ENBD":
-        if st.session_state.enbd_data.empty:
-            st.session_state.enbd_data = get_default_data_for_client("ENBD", st.session_state.start_date)
-    else:
-        if st.session_state.eib_data.empty:
-            st.session_state.eib_data = get_default_data_for_client("EIB", st.session_state.start_date)
+    if get_table(grid_key).empty:
+        append_rows(grid_key, get_default_data_for_client(client_select, st.session_state.start_date))
     
     st.markdown("---")
     st.subheader("✏️ Editable Data Grid")
     
-    current_data = st.session_state.enbd_data if client_select == "ENBD" else st.session_state.eib_data
+    current_data = get_table(grid_key)
     
     # Filter data based on selected date range
     filtered_data = current_data.copy()
@@ -1754,17 +3231,14 @@ def dashboard_data_tab():
     
     current_data = filtered_data
     if not current_data.empty:
-        edited_data = st.data_editor(
-            current_data,
-            key=f"client_data_editor_{client_select}",
-            use_container_width=True,
-            height=400
-        )
+        edited_page = paginated_grid(current_data, f"client_data_{client_select}", editable=True)
         
-        if client_select == "ENBD":
-            st.session_state.enbd_data = edited_data
-        else:
-            st.session_state.eib_data = edited_data
+        # Write back only the edited rows; rows outside the page and date filter stay untouched
+        edits = changed_rows(current_data, edited_page)
+        update_rows(grid_key, edits)
+        edited_data = current_data.copy()
+        if not edits.empty:
+            edited_data.loc[edits.index, edits.columns] = edits
         
         st.markdown("---")
         
@@ -1785,51 +3259,37 @@ def dashboard_data_tab():
     st.markdown("---")
     st.subheader("📤 Upload MASTERLIST")
     
-    uploaded_file = st.file_uploader(
-        "Upload Excel or CSV file",
+    uploaded_files = st.file_uploader(
+        "Upload Excel or CSV files",
         type=["xlsx", "xls", "csv"],
-        help="REMARK BY column will be used as AGENT_NAME"
+        accept_multiple_files=True,
+        help="REMARK BY column will be used as AGENT_NAME. Several files (e.g. one per team) are combined."
     )
     
-    if uploaded_file is not None:
+    if uploaded_files:
         try:
-            # Read file (capture REF sheet when present)
-            ref_df = None
-            if uploaded_file.name.endswith(".csv"):
-                df_uploaded = pd.read_csv(uploaded_file)
-            else:
-                sheets = pd.read_excel(uploaded_file, sheet_name=None)
-                # pick first non-REF sheet as main data, capture REF if exists
-                main_df = None
-                for name, sheet in sheets.items():
-                    if name.strip().upper() == 'REF':
-                        ref_df = sheet
-                    elif main_df is None:
-                        main_df = sheet
-                if main_df is None:
-                    # fallback to first sheet
-                    main_df = list(sheets.values())[0]
-                df_uploaded = main_df
-            
-            # Process
-            df_processed = process_masterlist(df_uploaded, st.session_state.start_date, client_select)
+            # Reruns with the same files, client and date only re-render the cached results
+            cache_key = upload_cache_key(uploaded_files, client_select, st.session_state.start_date)
+            if st.button("🔁 Recompute from scratch", help="Forget the rows already ingested for this date",
+                         key="reset_ingest_btn"):
+                reset_ingest(client_select, st.session_state.start_date)
+                st.session_state.upload_cache.pop(cache_key, None)
+            results = get_cached_upload(cache_key)
+            if results is None:
+                # Only rows not ingested by an earlier upload for this date are processed; each file is
+                # reduced to per-agent partials in parallel and merged into the date's running totals
+                results, new_rows, total_rows = ingest_masterlist_files(
+                    uploaded_files, st.session_state.start_date, client_select
+                )
+                cache_upload_results(cache_key, results)
+                st.caption(f"Processed {new_rows:,} new of {total_rows:,} rows ({total_rows - new_rows:,} already ingested)")
+            df_processed, account_counts, woa_per_agent, ptp_payment_data = results
+            if len(uploaded_files) > 1:
+                st.caption(f"Combined results of {len(uploaded_files)} files")
 
-            # Calculate account counts per agent (TOTAL_WOA, POSITIVE, RPC, NEGATIVE)
+            # Account counts per agent (TOTAL_WOA, POSITIVE, RPC, NEGATIVE)
             try:
-                account_counts = count_accounts_per_agent(df_uploaded)
                 if not account_counts.empty:
-                    # Drop the zero placeholder columns from df_processed first
-                    for col in ['TOTAL_WOA', 'POSITIVE', 'RPC', 'NEGATIVE']:
-                        if col in df_processed.columns:
-                            df_processed = df_processed.drop(columns=[col])
-                    
-                    # Now merge account counts into processed data by AGENT_USER
-                    df_processed = df_processed.merge(account_counts, on='AGENT_USER', how='left')
-                    # Fill NaN with 0
-                    for col in ['TOTAL_WOA', 'POSITIVE', 'RPC', 'NEGATIVE']:
-                        if col in df_processed.columns:
-                            df_processed[col] = df_processed[col].fillna(0).astype(int)
-                    
                     # Display account summary
                     st.markdown("### 📊 Account Summary by Status")
                     col1, col2, col3, col4 = st.columns(4)
@@ -1846,31 +3306,25 @@ def dashboard_data_tab():
             except Exception as e:
                 st.warning(f"Could not calculate account counts: {str(e)}")
 
-            # Calculate WOA counts per agent by time range
+            # WOA counts per agent by time range
             try:
-                woa_per_agent = calculate_woa_per_agent(df_uploaded)
                 if not woa_per_agent.empty:
-                    # Merge WOA counts into processed data by AGENT_USER
-                    df_processed = df_processed.merge(woa_per_agent, on='AGENT_USER', how='left')
-                    # Fill NaN with 0 for WOA columns
-                    df_processed['TOTAL_WOA (5pm)'] = df_processed['TOTAL_WOA (5pm)'].fillna(0).astype(int)
-                    df_processed['TOTAL_WOA (9pm)'] = df_processed['TOTAL_WOA (9pm)'].fillna(0).astype(int)
-                    
                     # Display WOA summary
                     st.markdown("### 📈 WOA by Time Range")
-                    st.write(f"**12:00 PM - 5:00 PM total: {woa_per_agent['TOTAL_WOA (5pm)'].sum()}**")
-                    st.write(f"**5:01 PM - 12:00 AM total: {woa_per_agent['TOTAL_WOA (9pm)'].sum()}**")
+                    for label, start, end in WOA_WINDOWS:
+                        start_t = (dt.min + timedelta(seconds=_seconds_of_day(start))).strftime('%I:%M:%S %p')
+                        end_t = (dt.min + timedelta(seconds=_seconds_of_day(end))).strftime('%I:%M:%S %p')
+                        st.write(f"**{start_t} - {end_t} total: {woa_per_agent[label].sum()}**")
                     st.dataframe(woa_per_agent, use_container_width=True)
                     st.markdown("---")
             except Exception as e:
                 st.warning(f"Could not calculate WOA: {str(e)}")
 
-            # Calculate PTP and Payment records per agent
-                         # Calculate PTP and Payment records per agent
+            # Summarize PTP and Payment records per agent
             try:
-                ptp_payment_data = get_ptp_and_payment_data(df_uploaded)
-
                 if not ptp_payment_data.empty:
+                    # Work on a copy so the cached results stay untouched
+                    ptp_payment_data = ptp_payment_data.copy()
                     ptp_payment_data['PARTIAL_AMOUNT'] = (
                         ptp_payment_data['PTP_PARTIAL_AMOUNT'].fillna(0) +
                         ptp_payment_data['PAYMENT_PARTIAL_AMOUNT'].fillna(0)
@@ -1944,59 +3398,24 @@ def dashboard_data_tab():
                 df_processed = st.session_state.pending_upload['df_processed']
                 client_select = st.session_state.pending_upload['client_select']
                 
-                # Get current session data
-                current_session_data = st.session_state.enbd_data if client_select == "ENBD" else st.session_state.eib_data
+                grid_key = "enbd_data" if client_select == "ENBD" else "eib_data"
                 
                 # Ensure AGENT_USER exists in processed
                 if "AGENT_USER" not in df_processed.columns:
                     df_processed["AGENT_USER"] = df_processed["AGENT_NAME"].map({v: k for k, v in AGENT_USER_TO_NAME.items()}).fillna("")
 
-                # Merge uploaded data with current session data by AGENT_USER (accumulate/update)
-                if not current_session_data.empty:
-                    # Create a copy of current data
-                    merged = current_session_data.copy()
-                    
-                    # For each uploaded agent, update or add their metrics
-                    for idx, row in df_processed.iterrows():
-                        agent_user = row['AGENT_USER'] if 'AGENT_USER' in row.index else ''
-                        
-                        # Find row in merged by AGENT_USER
-                        matching_rows = merged[merged['AGENT_USER'] == agent_user]
-                        
-                        if not matching_rows.empty:
-                            # Update existing agent's metrics
-                            match_idx = matching_rows.index[0]
-                            for col in ['TOTAL_WOA (5pm)', 'TOTAL_WOA (9pm)', 'TOTAL_WOA', 'POSITIVE', 'RPC', 'NEGATIVE', 'PTP_PAYMENT_COUNT', 'PTP_PAYMENT_AMOUNT', 'PTP_PARTIAL_COUNT', 'PTP_PARTIAL_AMOUNT', 'PAYMENT_PARTIAL_COUNT', 'PAYMENT_PARTIAL_AMOUNT', 'PTP_SETTLEMENT_COUNT', 'PTP_SETTLEMENT_AMOUNT', 'PAYMENT_SETTLEMENT_COUNT', 'PAYMENT_SETTLEMENT_AMOUNT']:
-                                if col in row.index and pd.notna(row[col]):
-                                    merged.at[match_idx, col] = row[col]
-                        else:
-                            # Add new agent (shouldn't happen as defaults include all agents)
-                            merged = pd.concat([merged, pd.DataFrame([row])], ignore_index=True)
-                    
-                else:
-                    # No existing data, use defaults and overlay processed values
-                    merged = get_default_data_for_client(client_select, st.session_state.start_date)
-                    
-                    for idx, row in df_processed.iterrows():
-                        agent_user = row['AGENT_USER'] if 'AGENT_USER' in row.index else ''
-                        matching_rows = merged[merged['AGENT_USER'] == agent_user]
-                        
-                        if not matching_rows.empty:
-                            match_idx = matching_rows.index[0]
-                            for col in ['TOTAL_WOA (5pm)', 'TOTAL_WOA (9pm)', 'TOTAL_WOA', 'POSITIVE', 'RPC', 'NEGATIVE', 'PTP_PAYMENT_COUNT', 'PTP_PAYMENT_AMOUNT', 'PTP_PARTIAL_COUNT', 'PTP_PARTIAL_AMOUNT', 'PAYMENT_PARTIAL_COUNT', 'PAYMENT_PARTIAL_AMOUNT', 'PTP_SETTLEMENT_COUNT', 'PTP_SETTLEMENT_AMOUNT', 'PAYMENT_SETTLEMENT_COUNT', 'PAYMENT_SETTLEMENT_AMOUNT']:
-                                if col in row.index and pd.notna(row[col]):
-                                    merged.at[match_idx, col] = row[col]
-
-                # Store updated data
-                if client_select == "ENBD":
-                    st.session_state.enbd_data = merged
-                else:
-                    st.session_state.eib_data = merged
+                # Upsert uploaded metrics into the grid by (AGENT_USER, START_DATE)
+                updated_count, inserted_count = upsert_agent_metrics(
+                    grid_key, df_processed, client_select, st.session_state.start_date
+                )
                 
                 # Clear pending upload
                 st.session_state.pending_upload = None
                 
-                st.success(f"✓ Data added to {client_select} grid!")
+                st.success(
+                    f"✓ Data added to {client_select} grid! "
+                    f"({updated_count} row(s) updated, {inserted_count} added)"
+                )
                 st.rerun()
                 
             except Exception as e:
@@ -2065,11 +3484,100 @@ def display_payment_data_overview():
 
 
 
+# ┌─────────────────────────────────────────────────────────────────────────────────┐
+# │                  HEADLESS BATCH PROCESSING                    │
+# └─────────────────────────────────────────────────────────────────────────────────┘
+
+MASTERLIST_SUFFIXES = (".csv", ".xlsx", ".xls")
+
+# START_DATE in a daily file name: 2025-01-31, 2025_01_31 or 20250131
+_FILE_DATE = re.compile(r'(?<!\d)(\d{4})[-_.]?(\d{2})[-_.]?(\d{2})(?!\d)')
+
+
+def masterlist_file_date(file_name):
+    """START_DATE encoded in a masterlist file name, or None"""
+    for match in _FILE_DATE.finditer(file_name):
+        try:
+            return datetime.date(*map(int, match.groups()))
+        except ValueError:
+            continue
+    return None
+
+
+def _batch_process_day(paths, start_date, client_name):
+    """
+    Process pool worker: merged per-agent metrics for one day's masterlist files, with each
+    file's processing time. A day's files are combined like a multi-file upload.
+    """
+    parts = [_timed_file_partials(path, index) for index, path in enumerate(paths)]
+    partials, has_account = reduce_file_partials(parts)
+    df_processed = finalize_masterlist(partials, start_date, client_name, has_account)[0]
+    return df_processed, [(os.path.basename(path), part[2]) for path, part in zip(paths, parts)]
+
+
+def batch_main(argv=None):
+    """
+    Backfill a directory of daily MASTERLIST files without the UI:
+        python streamlit-dashboard.py --batch DIR --client ENBD [--workers N]
+    Days are analyzed in parallel across a process pool (several files for one day are combined);
+    this process upserts each day's per-agent results into the client grid in the data store,
+    so it is the only writer.
+    """
+    parser = argparse.ArgumentParser(description="Process daily MASTERLIST files into the dashboard data store.")
+    parser.add_argument("--batch", required=True, metavar="DIR",
+                        help="directory of CSV/XLSX masterlists dated in the file name (several per day are combined)")
+    parser.add_argument("--client", required=True, choices=["ENBD", "EIB"])
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    jobs = {}
+    for name in sorted(os.listdir(args.batch)):
+        path = os.path.join(args.batch, name)
+        if not os.path.isfile(path) or not name.lower().endswith(MASTERLIST_SUFFIXES):
+            continue
+        start_date = masterlist_file_date(name)
+        if start_date is None:
+            print(f"skip {name}: no date in file name")
+            continue
+        jobs.setdefault(start_date, []).append(path)
+    if not jobs:
+        print(f"No dated masterlist files in {args.batch}")
+        return 1
+
+    grid_key = "enbd_data" if args.client == "ENBD" else "eib_data"
+    started = time.perf_counter()
+    failed = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {
+            pool.submit(_batch_process_day, paths, start_date, args.client): start_date
+            for start_date, paths in jobs.items()
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            start_date = futures[future]
+            progress = f"[{done}/{len(jobs)}] {start_date}"
+            try:
+                df_processed, timings = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"{progress}: FAILED - {e}", flush=True)
+                continue
+            updated, inserted = upsert_agent_metrics(grid_key, df_processed, args.client, start_date)
+            print(f"{progress}: {len(df_processed)} agents, {updated} updated, {inserted} added", flush=True)
+            for name, seconds in timings:
+                print(f"    {name}: {seconds:.2f}s", flush=True)
+
+    print(f"Processed {len(jobs) - failed}/{len(jobs)} days in {time.perf_counter() - started:.2f}s")
+    return 1 if failed else 0
+
+
 # ┌─────────────────────────────────────────────────────────────────────────────────┐
 # │                  MAIN APPLICATION LOGIC                       │
 # └─────────────────────────────────────────────────────────────────────────────────┘
 
-if not st.session_state.logged_in:
+if HEADLESS:
+    if __name__ == "__main__":
+        raise SystemExit(batch_main())
+elif not st.session_state.logged_in:
     login_page()
 else:
     check_logout()
@@ -0,0 +1,146 @@
+"""
+Parity of the vectorized count_accounts_per_agent with the per-agent loop it replaced.
+"""
+import os
+import runpy
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "streamlit-dashboard.py")
+
+
+@pytest.fixture(scope="module")
+def app():
+    # Keep the column-override table out of the real data store
+    os.environ["DASHBOARD_DATA_STORE"] = os.path.join(tempfile.mkdtemp(), "dashboard.sqlite3")
+    return runpy.run_path(APP_PATH, run_name="dashboard")
+
+
+def legacy_count_accounts_per_agent(app, df, account_col='Account', status_col='Status', agent_col=None,
+                                    amount_col='Amount'):
+    """Frozen copy of the original per-agent loop"""
+    STATUS_POSITIVE, STATUS_RPC, STATUS_NEGATIVE = app['STATUS_POSITIVE'], app['STATUS_RPC'], app['STATUS_NEGATIVE']
+    if df is None or df.empty:
+        return pd.DataFrame(columns=['AGENT_USER', 'TOTAL_WOA', 'POSITIVE', 'RPC', 'NEGATIVE'])
+
+    dff = df.copy()
+
+    # Auto-detect agent column if not provided
+    if agent_col is None:
+        cols_upper = {c: c.upper() for c in dff.columns}
+        agent_col = next((c for c, cu in cols_upper.items() if cu in ('REMARK BY', 'REMARKBY')), None)
+        if agent_col is None:
+            agent_col = next((c for c, cu in cols_upper.items() if 'AGENT' in cu), None)
+
+    # Auto-detect status and account columns
+    cols_upper = {c: c.upper() for c in dff.columns}
+    if status_col not in dff.columns:
+        status_col = next((c for c, cu in cols_upper.items() if 'STATUS' in cu), None)
+    if account_col not in dff.columns:
+        account_col = next((c for c, cu in cols_upper.items() if 'ACCOUNT' in cu or 'ACCT' in cu), None)
+    if amount_col not in dff.columns:
+        amount_col = next((c for c, cu in cols_upper.items() if 'AMOUNT' in cu), None)
+
+    if not agent_col or not account_col or not status_col:
+        return pd.DataFrame(columns=['AGENT_USER', 'TOTAL_WOA', 'POSITIVE', 'RPC', 'NEGATIVE'])
+
+    # Normalize columns
+    dff[agent_col] = dff[agent_col].astype(str).str.strip().str.upper()
+    dff[account_col] = dff[account_col].astype(str).str.strip()
+    dff[status_col] = dff[status_col].astype(str).str.strip().str.upper()
+
+    def _clean_numeric_series(s):
+        ss = s.fillna('').astype(str).str.strip()
+        # remove commas, currency symbols, parentheses and any non-numeric except dot and minus
+        ss = ss.str.replace(r'[^0-9\.\-]', '', regex=True)
+        ss = ss.replace('', '0')
+        return pd.to_numeric(ss, errors='coerce').fillna(0)
+
+    if amount_col:
+        dff[amount_col] = _clean_numeric_series(dff[amount_col])
+    else:
+        dff['__amount'] = 0
+        amount_col = '__amount'
+
+    # Group by agent
+    result = []
+    for agent in dff[agent_col].unique():
+        if not agent or agent == '':
+            continue
+
+        agent_data = dff[dff[agent_col] == agent]
+
+        # P: All unique accounts
+        p_count = len(agent_data[account_col].unique())
+
+        # Q: Status in STATUS_POSITIVE AND amount <= 1
+        q_data = agent_data[
+            (agent_data[status_col].isin([s.upper() for s in STATUS_POSITIVE])) &
+            (agent_data[amount_col] <= 1)
+        ]
+        q_count = len(q_data[account_col].unique())
+
+        # R: Status in STATUS_RPC
+        r_data = agent_data[agent_data[status_col].isin([s.upper() for s in STATUS_RPC])]
+        r_count = len(r_data[account_col].unique())
+
+        # S: Status in STATUS_NEGATIVE
+        s_data = agent_data[agent_data[status_col].isin([s.upper() for s in STATUS_NEGATIVE])]
+        s_count = len(s_data[account_col].unique())
+
+        result.append({
+            'AGENT_USER': agent,
+            'TOTAL_WOA': p_count,
+            'POSITIVE': q_count,
+            'RPC': r_count,
+            'NEGATIVE': s_count
+        })
+
+    return pd.DataFrame(result)
+
+
+def masterlist(app, n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    agents = np.array(list(app['AGENT_USER_TO_NAME'])[:6] + [' ctbonifacio ', 'SYSTEM', '', None], dtype=object)
+    statuses = np.array(
+        app['STATUS_POSITIVE'] + app['STATUS_RPC'] + app['STATUS_NEGATIVE']
+        + ['PTP - NEW', ' other ', None, 'ptp - follow up'],
+        dtype=object
+    )
+    accounts = np.array([f" {i} " for i in range(1000, 1000 + n // 5)] + [None], dtype=object)
+    return pd.DataFrame({
+        'REMARK BY': rng.choice(agents, n),
+        'Account': rng.choice(accounts, n),
+        'Status': rng.choice(statuses, n),
+        'Amount': rng.choice(np.array(['0', '1', '1,500.00', '', '2', 'AED 0.50', None], dtype=object), n),
+    })
+
+
+def assert_parity(app, df):
+    expected = legacy_count_accounts_per_agent(app, df)
+    actual = app['count_accounts_per_agent'](df)
+    # Agents in order of first appearance, with the same counts
+    assert list(actual['AGENT_USER']) == list(expected['AGENT_USER'])
+    pd.testing.assert_frame_equal(
+        actual.reset_index(drop=True), expected.reset_index(drop=True),
+        check_dtype=False, check_names=False
+    )
+
+
+def test_parity_with_null_agents_and_accounts(app):
+    assert_parity(app, masterlist(app))
+
+
+def test_parity_without_amount_column(app):
+    assert_parity(app, masterlist(app, seed=1).drop(columns='Amount'))
+
+
+def test_parity_with_non_default_index(app):
+    df = masterlist(app, seed=2)
+    df.index = pd.Index(np.random.default_rng(3).permutation(len(df)) * 7 + 100)
+    assert_parity(app, df)
+    df.index = pd.Index([f"row{i}" for i in range(len(df))])
+    assert_parity(app, df)